@@ -0,0 +1,358 @@
+"""
+Offline asset bundling for generated pages
+
+Generated pages pull fonts, icon sets and stylesheets from CDNs. The
+AssetBundler resolves those references against a local, content-addressed
+AssetCache, drops what the page does not use and either inlines the rest
+or rewrites it to hashed URLs served by our own static server.
+
+Seed the cache from local fixture files with:
+
+    python assets.py seed path/to/fixtures
+
+where the fixture directory holds a manifest.json mapping each URL to a
+file in that directory.
+"""
+import base64
+import contextlib
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import sys
+import tempfile
+import threading
+import urllib.request
+from collections import OrderedDict
+from urllib.parse import urljoin, urlparse
+
+import settings
+from factory import BaseModel
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows; fall back to the thread lock
+    fcntl = None
+
+class AssetCache(BaseModel):
+    """Local, content-addressed copies of third-party assets keyed by URL"""
+
+    INDEX_FILE = "index.json"
+    USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36"
+
+    def __init__(self, cache_dir=None, fetch=None, fixtures_dir=None):
+        self.cache_dir = cache_dir or settings.ASSET_CACHE_DIR
+        self.fetch = settings.ASSET_FETCH if fetch is None else fetch
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._index = self._load_index()
+        fixtures_dir = fixtures_dir or settings.ASSET_FIXTURES_DIR
+        if fixtures_dir:
+            self.seed(fixtures_dir)
+
+    def _load_index(self):
+        try:
+            with open(os.path.join(self.cache_dir, self.INDEX_FILE), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    @contextlib.contextmanager
+    def _index_lock(self):
+        """Serialize index updates across threads and worker processes"""
+        with self._lock, open(os.path.join(self.cache_dir, ".lock"), "w") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+    def _save_index(self):
+        # Write to a temp file and rename so other workers never see a partial index
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(self._index, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, os.path.join(self.cache_dir, self.INDEX_FILE))
+
+    @staticmethod
+    def _extension(url, mime):
+        ext = os.path.splitext(urlparse(url).path)[1]
+        if ext:
+            return ext.lower()
+        return mimetypes.guess_extension(mime or "") or ".bin"
+
+    def path(self, file_name):
+        """Absolute path of a cached file"""
+        return os.path.join(self.cache_dir, file_name)
+
+    def store(self, data, ext):
+        """Write content under its hash and return the file name"""
+        file_name = hashlib.sha256(data).hexdigest()[:16] + ext
+        path = self.path(file_name)
+        if not os.path.exists(path):
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return file_name
+
+    def put(self, url, data, mime=None):
+        """Cache the content of a URL"""
+        mime = mime or mimetypes.guess_type(urlparse(url).path)[0] or "application/octet-stream"
+        file_name = self.store(data, self._extension(url, mime))
+        with self._index_lock():
+            # Merge into what other workers wrote since this one last read the index
+            self._index = dict(self._index, **self._load_index())
+            self._index[url] = {"file": file_name, "type": mime}
+            self._save_index()
+        return file_name
+
+    def get(self, url):
+        """Return (data, mime type, file name) for a URL, or None on a cache miss"""
+        with self._lock:
+            entry = self._index.get(url)
+            if entry is None:
+                # Another worker may have added it since we loaded the index
+                self._index = self._load_index()
+                entry = self._index.get(url)
+        if entry is None and self.fetch:
+            self._download(url)
+            entry = self._index.get(url)
+        if entry is None:
+            return None
+        try:
+            with open(self.path(entry["file"]), "rb") as f:
+                return f.read(), entry["type"], entry["file"]
+        except OSError:
+            return None
+
+    def _download(self, url):
+        try:
+            request = urllib.request.Request(url, headers={"User-Agent": self.USER_AGENT})
+            with urllib.request.urlopen(request, timeout=10) as response:
+                mime = response.headers.get_content_type()
+                self.put(url, response.read(), mime)
+        except Exception:
+            pass
+
+    def seed(self, fixtures_dir):
+        """Load assets from a fixture directory with a manifest.json of URL -> file"""
+        with open(os.path.join(fixtures_dir, "manifest.json"), encoding="utf-8") as f:
+            manifest = json.load(f)
+        for url, relative_path in manifest.items():
+            with open(os.path.join(fixtures_dir, relative_path), "rb") as f:
+                self.put(url, f.read())
+        return len(manifest)
+
+class AssetBundler(BaseModel):
+    """Resolves CDN fonts, icons and stylesheets in a page against the local asset cache"""
+
+    TAG_LINK = re.compile(r"<link\b[^>]*>", re.I)
+    STYLE_BLOCK = re.compile(r"(<style[^>]*>)(.*?)(</style>)", re.S | re.I)
+    ATTRIBUTE = re.compile(r"""\b([\w-]+)\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+))""")
+    CSS_IMPORT = re.compile(r"""@import\s+(?:url\(\s*)?["']?(https?://[^"')\s;]+)["']?\s*\)?[^;]*;""", re.I)
+    CSS_URL = re.compile(r"""url\(\s*(["']?)([^"')]+)\1\s*\)""")
+    CSS_COMMENT = re.compile(r"/\*.*?\*/", re.S)
+    UNICODE_RANGE = re.compile(r"unicode-range\s*:\s*([^;}]+)", re.I)
+    # Selectors like ".fa-house:before" that only matter if the page uses the class
+    ICON_SELECTOR = re.compile(r"^\.((?:fa|bi|ri|la|ti)-[\w-]+)(?:::?(?:before|after))?$")
+    FONT_TYPES = {".woff2": "font/woff2", ".woff": "font/woff", ".ttf": "font/ttf", ".otf": "font/otf"}
+    MAX_PRELOADS = 4
+
+    def __init__(self, cache=None, url_prefix=None, preview_entries=None):
+        self.cache = cache or AssetCache()
+        self.url_prefix = url_prefix or settings.ASSET_URL_PREFIX
+        self.preview_entries = preview_entries or settings.ASSET_PREVIEW_ENTRIES
+        self._previews = OrderedDict()
+        self._previews_lock = threading.Lock()
+
+    def _attributes(self, tag):
+        return {
+            match.group(1).lower(): next(value for value in match.groups()[1:] if value is not None)
+            for match in self.ATTRIBUTE.finditer(tag)
+        }
+
+    @staticmethod
+    def _split_rules(css):
+        """Split a stylesheet into top-level (prelude, body) pairs; body is None for statements"""
+        rules = []
+        depth = 0
+        start = 0
+        prelude_end = 0
+        for i, char in enumerate(css):
+            if char == "{":
+                if depth == 0:
+                    prelude_end = i
+                depth += 1
+            elif char == "}":
+                depth -= 1
+                if depth == 0:
+                    rules.append((css[start:prelude_end], css[prelude_end + 1:i]))
+                    start = i + 1
+            elif char == ";" and depth == 0:
+                rules.append((css[start:i + 1], None))
+                start = i + 1
+        return rules
+
+    @staticmethod
+    def _covers(unicode_range, code_points):
+        """Whether any of the page's characters fall inside a unicode-range"""
+        for part in unicode_range.split(","):
+            part = part.strip().upper()
+            if part.startswith("U+"):
+                part = part[2:]
+            try:
+                if "?" in part:
+                    low, high = int(part.replace("?", "0"), 16), int(part.replace("?", "F"), 16)
+                elif "-" in part:
+                    low, high = (int(bound, 16) for bound in part.split("-", 1))
+                else:
+                    low = high = int(part, 16)
+            except ValueError:
+                return True
+            if any(low <= code_point <= high for code_point in code_points):
+                return True
+        return False
+
+    def _subset(self, css, html_content, code_points):
+        """Drop @font-face blocks for scripts the page doesn't use and unused icon rules"""
+        kept = []
+        for prelude, body in self._split_rules(self.CSS_COMMENT.sub("", css)):
+            if body is None:
+                kept.append(prelude)
+                continue
+            selector = prelude.strip()
+            if selector.lower().startswith("@font-face"):
+                unicode_range = self.UNICODE_RANGE.search(body)
+                if unicode_range and not self._covers(unicode_range.group(1), code_points):
+                    continue
+            elif not selector.startswith("@"):
+                icons = [self.ICON_SELECTOR.match(part.strip()) for part in selector.split(",")]
+                if all(icons) and not any(icon.group(1) in html_content for icon in icons):
+                    continue
+            kept.append(f"{selector}{{{body}}}")
+        return "".join(kept)
+
+    def _asset_url(self, url, mode, report):
+        """Local replacement for an asset referenced from a stylesheet"""
+        if url.startswith("data:"):
+            return url
+        cached = self.cache.get(url)
+        if cached is None:
+            report["missing"].append(url)
+            return url
+        data, mime, file_name = cached
+        if mode == "inline":
+            return f"data:{mime};base64,{base64.b64encode(data).decode('ascii')}"
+        ext = os.path.splitext(file_name)[1]
+        if ext in self.FONT_TYPES and len(report["preload"]) < self.MAX_PRELOADS:
+            report["preload"].append((self.url_prefix + file_name, self.FONT_TYPES[ext]))
+        report["files"].add(file_name)
+        # Resolved stylesheets are written next to their assets, so URLs
+        # inside them are bare file names; only the page uses the prefix
+        return file_name
+
+    def _resolve_stylesheet(self, url, html_content, code_points, mode, report):
+        cached = self.cache.get(url)
+        if cached is None:
+            report["missing"].append(url)
+            return None
+        css = self._subset(cached[0].decode("utf-8", errors="replace"), html_content, code_points)
+        css = self.CSS_URL.sub(
+            lambda m: f"url({self._asset_url(urljoin(url, m.group(2)), mode, report)})",
+            css
+        )
+        report["resolved"].append(url)
+        return css
+
+    def process(self, html_content, mode="inline"):
+        """Rewrite a page to use locally cached assets
+
+        mode is "inline" to embed everything in the page (used for previews)
+        or "hashed" to point at content-hashed files under the asset URL
+        prefix. Returns the new HTML and a report of what was resolved.
+        """
+        report = {"resolved": [], "missing": [], "preload": [], "files": set()}
+        code_points = {ord(char) for char in html_content}
+        original = html_content
+
+        def stylesheet(css):
+            if mode == "inline":
+                # Marked so preview patches only ever touch the page's own style blocks
+                return f"<style data-asset>{css}</style>"
+            file_name = self.cache.store(css.encode("utf-8"), ".css")
+            report["files"].add(file_name)
+            return f'<link rel="stylesheet" href="{self.url_prefix}{file_name}">'
+
+        def replace_link(match):
+            attributes = self._attributes(match.group(0))
+            href = attributes.get("href", "")
+            if "stylesheet" not in attributes.get("rel", "").lower() or not href.startswith(("http://", "https://")):
+                return match.group(0)
+            css = self._resolve_stylesheet(href, original, code_points, mode, report)
+            return match.group(0) if css is None else stylesheet(css)
+
+        def replace_import(match):
+            css = self._resolve_stylesheet(match.group(1), original, code_points, mode, report)
+            return match.group(0) if css is None else css
+
+        def replace_style(match):
+            # @import must stay first in a stylesheet, so pull imported
+            # rules out into their own block ahead of the original one
+            imported = []
+            body = self.CSS_IMPORT.sub(lambda m: imported.append(replace_import(m)) or "", match.group(2))
+            resolved = [css for css in imported if not css.lstrip().startswith("@import")]
+            unresolved = [css for css in imported if css.lstrip().startswith("@import")]
+            prefix = "".join(stylesheet(css) for css in resolved)
+            return prefix + match.group(1) + "".join(unresolved) + body + match.group(3)
+
+        html_content = self.TAG_LINK.sub(replace_link, html_content)
+        html_content = self.STYLE_BLOCK.sub(replace_style, html_content)
+
+        # Preconnect hints to CDNs we no longer talk to only cost a round-trip
+        def drop_stale_hint(match):
+            attributes = self._attributes(match.group(0))
+            if attributes.get("rel", "").lower() not in ("preconnect", "dns-prefetch"):
+                return match.group(0)
+            host = urlparse(attributes.get("href", "")).netloc
+            return match.group(0) if host and host in html_content.replace(match.group(0), "") else ""
+        html_content = self.TAG_LINK.sub(drop_stale_hint, html_content)
+
+        if report["preload"]:
+            hints = "".join(
+                f'<link rel="preload" href="{href}" as="font" type="{mime}" crossorigin>'
+                for href, mime in report["preload"]
+            )
+            if re.search(r"<head[^>]*>", html_content, re.I):
+                html_content = re.sub(r"(<head[^>]*>)", lambda m: m.group(1) + hints, html_content, count=1, flags=re.I)
+            else:
+                html_content = hints + html_content
+
+        return html_content, report
+
+    def inline(self, html_content):
+        """Preview copy of a page with every cached asset embedded, cached by content hash
+
+        Only previews get this copy; the stored page keeps its CDN links so
+        follow-ups, downloads and publishing never carry embedded fonts.
+        """
+        key = hashlib.sha256(html_content.encode("utf-8")).hexdigest()[:16]
+        with self._previews_lock:
+            if key in self._previews:
+                self._previews.move_to_end(key)
+                return self._previews[key]
+        try:
+            preview, _ = self.process(html_content, mode="inline")
+        except Exception:
+            preview = html_content
+        with self._previews_lock:
+            self._previews[key] = preview
+            while len(self._previews) > self.preview_entries:
+                self._previews.popitem(last=False)
+        return preview
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3 or sys.argv[1] != "seed":
+        print("usage: python assets.py seed <fixtures_dir>")
+        sys.exit(1)
+    count = AssetCache(fixtures_dir="").seed(sys.argv[2])
+    print(f"Seeded {count} assets into {settings.ASSET_CACHE_DIR}")
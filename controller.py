@@ -1,69 +1,46 @@
+import hmac
+
 import streamlit as st
+import settings
 from factory import app_factory
 
 class AppController:
     """Main controller that coordinates the application"""
     
     def __init__(self):
-        self.session = app_factory.create_model("ChatSession")
+        self.store = app_factory.create_model("SessionStore")
         self.html_generator = app_factory.create_model("HTMLGenerator")
         self.file_manager = app_factory.create_model("FileManager")
+        self.exporter = app_factory.create_model("SiteExporter")
+        self.asset_bundler = app_factory.create_model("AssetBundler")
+        self.publisher = app_factory.create_model("StaticPublisher")
+        self.preview_patcher = app_factory.create_model("PreviewPatcher")
+        self.job_executor = app_factory.create_model("JobExecutor")
+        self.profiler = app_factory.create_model("RerunProfiler")
+        self.style_bundle = app_factory.create_model("StyleBundle")
+        self.html_optimizer = app_factory.create_model("HTMLOptimizer")
+        self.section_indexer = app_factory.create_model("SectionIndexer")
+        self.speculator = app_factory.create_model("SpeculativeEditor")
         self._initialize_session_state()
+        self.session = self.store.load_session(st.session_state.session_id)
     
     def _initialize_session_state(self):
         """Initialize Streamlit session state"""
-        if 'messages' not in st.session_state:
-            st.session_state.messages = []
-        
-        if 'current_personality' not in st.session_state:
-            st.session_state.current_personality = "HTML Generator"
-        
-        if 'generated_html' not in st.session_state:
-            st.session_state.generated_html = None
-        
-        if 'html_file_path' not in st.session_state:
-            st.session_state.html_file_path = None
+        # Only the session id lives in Streamlit's memory; messages and HTML
+        # are kept in the session store. The id is mirrored into the URL so a
+        # reload, restart or another replica resumes the same conversation.
+        if 'session_id' not in st.session_state:
+            session_id = st.query_params.get("sid")
+            if not session_id or not self.store.session_exists(session_id):
+                session_id = self.store.create_session()
+            st.session_state.session_id = session_id
         
-        if 'show_results' not in st.session_state:
-            st.session_state.show_results = False
-        
-        if 'current_html' not in st.session_state:
-            st.session_state.current_html = None
-        
-        if 'show_published' not in st.session_state:
-            st.session_state.show_published = False
+        if st.query_params.get("sid") != st.session_state.session_id:
+            st.query_params["sid"] = st.session_state.session_id
     
     def _sync_session_state(self):
-        """Sync controller state with Streamlit session state"""
-        # Update session state with controller state
-        st.session_state.messages = [msg.to_dict() for msg in self.session.messages]
-        st.session_state.current_personality = self.session.current_personality
-        st.session_state.generated_html = self.session.generated_html
-        st.session_state.html_file_path = self.session.html_file_path
-        st.session_state.show_results = self.session.show_results
-        st.session_state.current_html = self.session.current_html
-        st.session_state.show_published = self.session.show_published
-    
-    def _load_from_session_state(self):
-        """Load controller state from Streamlit session state"""
-        # Convert dict messages back to Message objects
-        self.session.messages = []
-        for msg_dict in st.session_state.messages:
-            message = app_factory.create_model(
-                "Message",
-                role=msg_dict["role"],
-                content=msg_dict["content"],
-                personality=msg_dict.get("personality"),
-                html_content=msg_dict.get("html_content")
-            )
-            self.session.messages.append(message)
-        
-        self.session.current_personality = st.session_state.current_personality
-        self.session.generated_html = st.session_state.generated_html
-        self.session.html_file_path = st.session_state.html_file_path
-        self.session.show_results = st.session_state.show_results
-        self.session.current_html = st.session_state.current_html
-        self.session.show_published = st.session_state.show_published
+        """Persist controller state to the session store"""
+        self.session.save()
     
     def add_message(self, role, content, personality=None, html_content=None):
         """Add a message to the chat history"""
@@ -71,7 +48,7 @@ class AppController:
         self.session.add_message(message)
         
         # If HTML content is provided, open it in browser
-        if html_content:
+        if html_content and settings.OPEN_IN_BROWSER:
             try:
                 file_path, error = self.file_manager.save_and_open_html(html_content, content)
                 if file_path:
@@ -83,14 +60,79 @@ class AppController:
         
         self._sync_session_state()
     
+    def _postprocess_html(self, html_content):
+        """Run generated HTML through the post-generation pipeline"""
+        # CDN assets stay as links here: they are inlined for previews
+        # (_render_preview) and hashed for publishing and export only
+        
+        # Dedupe CSS, defer scripts and minify, if the personality wants it.
+        # Unused rules stay: later edits and scripts may still need them
+        if self._optimizes():
+            html_content, _ = self.html_optimizer.optimize(html_content, prune=False)
+        return html_content
+    
+    def _optimizes(self):
+        personality = self.html_generator.PERSONALITIES.get(self.session.current_personality, {})
+        return personality.get("optimize", False)
+    
+    def _output_html(self, html_content):
+        """Copy of the page for publishing and export, without CSS it never uses"""
+        if self._optimizes():
+            html_content, _ = self.html_optimizer.optimize(html_content)
+        return html_content
+    
+    def _generation_task(self, prompt, current_html=None):
+        """Snapshot what a generation needs so it can run off the script thread"""
+        personality = self.session.current_personality
+        history = list(self.session.messages)
+        
+        def task(cancel_event=None, on_chunk=None):
+            # A follow-up about one part of the page only regenerates that part
+            plan = self.section_indexer.plan_edit(current_html, prompt) if current_html else None
+            if plan is not None:
+                output, error = self.html_generator.edit_fragment(
+                    prompt,
+                    personality,
+                    history,
+                    plan["fragment"],
+                    css=plan["css"],
+                    label=plan["label"],
+                    cancel_event=cancel_event,
+                    on_chunk=on_chunk
+                )
+                html_content = self.section_indexer.apply_edit(current_html, plan, output) if output else None
+                if html_content:
+                    return html_content, None
+                if cancel_event is not None and cancel_event.is_set():
+                    return None, error or "Generation cancelled"
+            
+            return self.html_generator.generate_html(
+                prompt,
+                personality,
+                history=history,
+                current_html=current_html,
+                cancel_event=cancel_event,
+                on_chunk=on_chunk
+            )
+        return task
+    
+    def _apply_html(self, html_content, show_results=False):
+        """Make freshly generated HTML the session's current website"""
+        html_content = self._postprocess_html(html_content)
+        self.session.current_html = html_content
+        if show_results:
+            self.session.show_results = True
+        self._sync_session_state()
+        return html_content
+    
     def generate_html(self, prompt):
         """Generate HTML using the AI model"""
         try:
-            html_content, error = self.html_generator.generate_html(prompt, self.session.current_personality)
+            html_content, error = self._generation_task(prompt)()
             
             if html_content:
-                self.session.current_html = html_content
-                self.session.show_results = True
+                html_content = self._apply_html(html_content, show_results=True)
+                self._speculate()
                 return html_content, None
             else:
                 return None, error
@@ -101,21 +143,96 @@ class AppController:
     def update_website(self, prompt):
         """Update existing website with new prompt"""
         try:
-            html_content, error = self.html_generator.generate_html(prompt, self.session.current_personality)
+            # A pre-generated follow-up is served as is
+            error = None
+            html_content = self.speculator.take(self.session.session_id, self.session.current_html, prompt)
+            if html_content is None:
+                # Send the conversation and the current page so follow-ups keep context
+                html_content, error = self._generation_task(prompt, self.session.current_html)()
             
             if html_content:
-                self.session.current_html = html_content
-                return html_content, None
+                return self._apply_html(html_content), None
             else:
                 return None, error
                 
         except Exception as e:
             return None, f"Error updating HTML: {str(e)}"
     
+    def _start_generation_job(self, kind, prompt):
+        """Run a generation ("generate" or "update") in the background"""
+        current_html = self.session.current_html if kind == "update" else None
+        task = self._generation_task(prompt, current_html)
+        
+        # A pre-generated follow-up finishes as soon as the job starts
+        speculated = self.speculator.take(self.session.session_id, current_html, prompt) if current_html else None
+        if speculated is not None:
+            def task(cancel_event=None, on_chunk=None):
+                return speculated, None
+        
+        job_id = self.job_executor.submit(self.session.session_id, kind, prompt, task)
+        st.session_state.active_job_id = job_id
+    
+    def _speculate(self):
+        """Pre-generate likely follow-ups to the page just generated (WEB_GEN_SPECULATION=1)"""
+        current_html = self.session.current_html
+        self.speculator.speculate(
+            self.session.session_id,
+            current_html,
+            lambda prompt: self._generation_task(prompt, current_html)
+        )
+    
+    def _finish_generation_job(self, job):
+        """Apply a finished background job to the session"""
+        personality = self.session.current_personality
+        if job.status == "done":
+            html_content = self._apply_html(job.result, show_results=job.kind == "generate")
+            if job.kind == "generate":
+                response = "✅ Website generated successfully!"
+            else:
+                response = "✅ Website updated successfully!"
+            self.add_message("assistant", response, personality, html_content)
+            if job.kind == "generate":
+                self._speculate()
+        elif job.status == "failed":
+            verb = "generate" if job.kind == "generate" else "update"
+            response = f"❌ Sorry, I couldn't {verb} the website. Error: {job.error}"
+            self.add_message("assistant", response, personality)
+        else:
+            self.add_message("assistant", "⏹️ Request cancelled.", personality)
+        
+        self.job_executor.forget(job.job_id)
+        st.session_state.pop("active_job_id", None)
+    
+    def _show_job_status(self):
+        """Poll the active background job; runs as a fragment on a timer"""
+        job = self.job_executor.get(st.session_state.get("active_job_id"))
+        if job is None:
+            st.session_state.pop("active_job_id", None)
+            st.rerun()
+        
+        if job.active:
+            chat_view = app_factory.create_view("ChatView")
+            if chat_view.display_job_status(job):
+                self.job_executor.cancel(job.job_id)
+            return
+        
+        self._finish_generation_job(job)
+        st.rerun()
+    
     def publish_website(self):
         """Publish the current website"""
+        if not self.session.site_id:
+            self.session.site_id = self.publisher.new_site_id()
+            # Sites used to be published under the session id; take that copy down
+            if self.publisher.get_site(self.session.session_id):
+                self.publisher.unpublish(self.session.session_id)
+        site, error = self.publisher.publish(self.session.site_id, self._output_html(self.session.current_html))
+        if error:
+            st.error(f"❌ {error}")
+            return
         self.session.show_published = True
         self._sync_session_state()
+        st.rerun()
     
     def go_back_to_editor(self):
         """Go back to editor from published view"""
@@ -131,15 +248,38 @@ class AppController:
         """Get filename for download"""
         return self.file_manager.get_download_filename()
     
+    def get_download_bundle(self):
+        """Get filename and a deferred payload for the zip site bundle"""
+        html_content = self.session.current_html
+        file_name = self.file_manager.get_download_filename().replace(".html", ".zip")
+        return file_name, lambda: self.exporter.bundle_bytes(self._output_html(html_content))
+    
     def run(self):
-        """Main application loop"""
-        # Load state from session
-        self._load_from_session_state()
-        
-        # Apply CSS styles
-        css_styles = app_factory.create_view("CSSStyles")
-        st.markdown(css_styles.get_main_styles(), unsafe_allow_html=True)
+        """Main application loop, profiled when this session or rerun asks for it"""
+        # ?profile=1 switches profiling on for the rest of the session, ?profile=0 off.
+        # Profiling slows every session in the process, so only operators may ask.
+        requested = st.query_params.get("profile")
+        if requested is not None and self._is_operator():
+            st.session_state.profile = requested == "1"
         
+        reason = self.profiler.reason_for(self.session.session_id, st.session_state.get("profile", False))
+        if reason is None:
+            self._run()
+        else:
+            with self.profiler.profile(self.session.session_id, reason):
+                self._run()
+    
+    def _is_operator(self):
+        """Whether this browser session presented the operator token (WEB_GEN_ADMIN_TOKEN)"""
+        token = st.query_params.get("admin")
+        if token is not None:
+            st.session_state.operator = bool(settings.ADMIN_TOKEN) and hmac.compare_digest(token, settings.ADMIN_TOKEN)
+            # Keep the token out of the address bar, links and screenshots
+            del st.query_params["admin"]
+        return bool(settings.ADMIN_TOKEN) and st.session_state.get("operator", False)
+    
+    def _run(self):
+        """Render the current page"""
         # Page configuration
         st.set_page_config(
             page_title="Build something lovable",
@@ -148,17 +288,50 @@ class AppController:
             initial_sidebar_state="collapsed"
         )
         
+        if self.session.show_results and not self.session.show_published:
+            page = "results"
+        elif self.session.show_published:
+            page = "published"
+        else:
+            page = "chat"
+        
+        # Apply CSS styles: one precomputed stylesheet per page, cached by the browser
+        st.markdown(self.style_bundle.tag(page), unsafe_allow_html=True)
+        
         # Main application flow
-        if self.session.show_published:
-            self._show_published_page()
-        elif self.session.show_results:
+        if page == "results":
             self._show_results_page()
         else:
-            self._show_chat_page()
+            # The live preview frame is unmounted on every other page
+            if "live_preview" in st.session_state:
+                st.session_state.live_preview["mounted"] = False
+            if page == "published":
+                self._show_published_page()
+            else:
+                self._show_chat_page()
+        
+        # Generations run in the background; poll the active one on a timer
+        if st.session_state.get("active_job_id"):
+            st.fragment(self._show_job_status, run_every=settings.JOB_POLL_SECONDS)()
         
         # Footer
         footer_view = app_factory.create_view("FooterView")
         footer_view.display_footer()
+        
+        # Operator diagnostics: ?debug=memory, jobs, optimizer, sections, speculation or profile
+        debug = st.query_params.get("debug") if self._is_operator() else None
+        if debug == "memory":
+            footer_view.display_metrics("Memory", self.store.get_memory_metrics())
+        elif debug == "jobs":
+            footer_view.display_metrics("Jobs", self.job_executor.get_metrics())
+        elif debug == "optimizer":
+            footer_view.display_metrics("HTML optimizer", self.html_optimizer.get_metrics())
+        elif debug == "sections":
+            footer_view.display_metrics("Targeted edits", self.section_indexer.get_metrics())
+        elif debug == "speculation":
+            footer_view.display_metrics("Speculative follow-ups", self.speculator.get_metrics())
+        elif debug == "profile":
+            footer_view.display_profiles(self.profiler.slowest_runs())
     
     def _show_chat_page(self):
         """Display the main chat page"""
@@ -172,25 +345,12 @@ class AppController:
             # Add user message
             self.add_message("user", user_input)
             
-            # Generate HTML with AI
-            with st.spinner("🤖 Generating your website..."):
-                html_content, error = self.generate_html(user_input)
-                
-                if html_content:
-                    response = f"✅ Website generated successfully!"
-                    self.add_message("assistant", response, self.session.current_personality, html_content)
-                    st.rerun()
-                else:
-                    response = f"❌ Sorry, I couldn't generate the website. Error: {error}"
-                    self.add_message("assistant", response, self.session.current_personality)
-                    st.rerun()
+            # Generate HTML with AI without blocking this script run
+            self._start_generation_job("generate", user_input)
+            st.rerun()
     
     def _show_results_page(self):
         """Display the results page"""
-        # Apply results-specific styles
-        css_styles = app_factory.create_view("CSSStyles")
-        st.markdown(css_styles.get_results_styles(), unsafe_allow_html=True)
-        
         # Back button
         results_view = app_factory.create_view("ResultsView")
         if results_view.display_back_button():
@@ -210,19 +370,73 @@ class AppController:
             )
         
         with col2:
-            # Results column
+            # Results column; while a generation runs the preview polls it
+            # on its own timer, so streamed output shows up as it arrives
+            polling = settings.JOB_POLL_SECONDS if st.session_state.get("active_job_id") else None
             results_view.display_results_column(
                 self.session.current_html,
                 self.publish_website,
-                self.get_download_filename
+                self.get_download_filename,
+                self.get_download_bundle,
+                st.fragment(self._render_preview, run_every=polling)
             )
     
+    def _render_preview(self, html_content):
+        """Update the live preview with only what changed since the last run"""
+        # Only the id of the version on screen is kept here; the HTML itself
+        # stays in the session store like every other version of the page
+        state = st.session_state.setdefault(
+            "live_preview", {"revision": 0, "html_id": None, "mounted": False, "nonce": None, "stream": None}
+        )
+        html_id = self.store.html_id(html_content)
+        
+        # The frame starts empty when it was not on screen before, and it
+        # asks for the full document when a patch could not be applied
+        feedback = st.session_state.get("live_preview_frame") or {}
+        reload_requested = feedback.get("reload") and feedback.get("nonce") != state["nonce"]
+        if reload_requested:
+            state["nonce"] = feedback.get("nonce")
+        
+        # A full page being generated is written into the frame as it streams
+        job = self.job_executor.get(st.session_state.get("active_job_id")) if st.session_state.get("active_job_id") else None
+        streamed = job.partial_text if job is not None else ""
+        stream = state.get("stream")
+        if reload_requested or not state["mounted"]:
+            stream = None
+        
+        # Resolve CDN fonts, icons and stylesheets so the preview renders offline
+        if reload_requested or not state["mounted"]:
+            ops = [{"op": "reload", "html": self.asset_bundler.inline(html_content)}]
+        elif self.preview_patcher.document_start(streamed) is not None:
+            if stream is None or stream["job_id"] != job.job_id:
+                stream = {"job_id": job.job_id, "sent": 0}
+            ops = self.preview_patcher.append(streamed, stream["sent"])
+            stream["sent"] = len(streamed)
+            # The frame no longer shows a stored version; the finished page replaces it
+            html_id = None
+        elif html_id == state["html_id"]:
+            ops = []
+        else:
+            # Diff the stored versions, not their inlined copies, so a style
+            # change never resends embedded fonts; only a reload inlines
+            previous = self.store.load_html(state["html_id"], self.session.session_id) if state["html_id"] else None
+            ops = self.preview_patcher.diff(previous, html_content)
+            if ops and ops[0]["op"] == "reload":
+                ops = [{"op": "reload", "html": self.asset_bundler.inline(html_content)}]
+            stream = None
+        
+        state["stream"] = stream
+        base_revision = state["revision"]
+        if ops:
+            state["revision"] += 1
+        state["html_id"] = html_id
+        state["mounted"] = True
+        
+        preview_view = app_factory.create_view("LivePreviewView")
+        preview_view.display_live_preview(ops, state["revision"], base_revision)
+    
     def _show_published_page(self):
         """Display the published page"""
-        # Apply published-specific styles
-        css_styles = app_factory.create_view("CSSStyles")
-        st.markdown(css_styles.get_published_styles(), unsafe_allow_html=True)
-        
         # Back button
         published_view = app_factory.create_view("PublishedView")
         if published_view.display_back_button():
@@ -230,21 +444,15 @@ class AppController:
             st.rerun()
         
         published_view.display_published_header()
-        published_view.display_published_website(self.session.current_html)
+        published_view.display_published_website(
+            self.asset_bundler.inline(self.session.current_html) if self.session.current_html else None,
+            self.publisher.get_site(self.session.site_id) if self.session.site_id else None
+        )
     
     def _handle_continue_chat(self, user_input):
         """Handle continuing chat in results view"""
         self.add_message("user", user_input)
         
-        # Generate updated HTML
-        with st.spinner("🤖 Updating your website..."):
-            html_content, error = self.update_website(user_input)
-            
-            if html_content:
-                response = f"✅ Website updated successfully!"
-                self.add_message("assistant", response, self.session.current_personality, html_content)
-                st.rerun()
-            else:
-                response = f"❌ Sorry, I couldn't update the website. Error: {error}"
-                self.add_message("assistant", response, self.session.current_personality)
-                st.rerun()
+        # Generate updated HTML in the background
+        self._start_generation_job("update", user_input)
+        st.rerun()
@@ -0,0 +1,120 @@
+import gzip
+import hashlib
+import io
+import re
+import threading
+import zipfile
+from collections import OrderedDict
+
+import settings
+from assets import AssetBundler
+from factory import BaseModel
+from minify import minify_css, minify_js
+
+class SiteExporter(BaseModel):
+    """Turns a generated single-file page into a multi-file site bundle"""
+
+    STYLE_BLOCK = re.compile(r"<style[^>]*>(.*?)</style>", re.S | re.I)
+    SCRIPT_BLOCK = re.compile(r"(<script\b[^>]*>)(.*?)</script>", re.S | re.I)
+    TYPE_ATTR = re.compile(r"""\btype\s*=\s*["']?([^"'\s>]+)""", re.I)
+    # Only classic inline scripts are merged; modules (whose imports are a
+    # SyntaxError in a classic file), external scripts and JSON/template
+    # blocks stay in place
+    CLASSIC_TYPES = ("", "text/javascript", "application/javascript")
+    GZIP_TYPES = (".html", ".css", ".js")
+    ASSET_DIR = "assets"
+
+    def __init__(self, cache_entries=None):
+        self.cache_entries = cache_entries or settings.EXPORT_CACHE_ENTRIES
+        self.asset_bundler = AssetBundler(url_prefix=f"{self.ASSET_DIR}/")
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def content_hash(html_content):
+        """Short content hash identifying one version of a page"""
+        return hashlib.sha256(html_content.encode("utf-8")).hexdigest()[:16]
+
+    def _classic_inline(self, open_tag):
+        type_match = self.TYPE_ATTR.search(open_tag)
+        script_type = type_match.group(1).lower() if type_match else ""
+        return script_type in self.CLASSIC_TYPES and not re.search(r"\bsrc\s*=", open_tag, re.I)
+
+    def split_assets(self, html_content, name_asset=None):
+        """Move inline CSS and JS into separate minified files
+
+        name_asset(default_name, content) may pick the final file name, e.g.
+        to add a content hash. Returns the rewritten HTML and a dict of file
+        name to contents.
+        """
+        files = {}
+        name_asset = name_asset or (lambda default_name, content: default_name)
+
+        styles = [match.group(1) for match in self.STYLE_BLOCK.finditer(html_content)]
+        if styles:
+            css = minify_css("\n".join(styles))
+            css_name = name_asset("styles.css", css)
+            files[css_name] = css
+            seen = [0]
+
+            def replace_style(match):
+                # The first block becomes the link so the cascade order is kept
+                seen[0] += 1
+                return f'<link rel="stylesheet" href="{css_name}">' if seen[0] == 1 else ""
+            html_content = self.STYLE_BLOCK.sub(replace_style, html_content)
+
+        scripts = [match.group(2) for match in self.SCRIPT_BLOCK.finditer(html_content) if self._classic_inline(match.group(1))]
+        if scripts:
+            js = minify_js(";\n".join(scripts))
+            js_name = name_asset("script.js", js)
+            files[js_name] = js
+            remaining = [len(scripts)]
+
+            def replace_script(match):
+                if not self._classic_inline(match.group(1)):
+                    return match.group(0)
+                # The last inline script becomes the tag, so all of them still
+                # run after the markup they originally followed
+                remaining[0] -= 1
+                return f'<script src="{js_name}"></script>' if remaining[0] == 0 else ""
+            html_content = self.SCRIPT_BLOCK.sub(replace_script, html_content)
+
+        return html_content, files
+
+    def bundle_files(self, html_content):
+        """All files of the bundle, including gzip-precompressed variants"""
+        # Local, hashed copies of CDN assets under assets/, with preload hints
+        html_content, asset_report = self.asset_bundler.process(html_content, mode="hashed")
+        index_html, assets = self.split_assets(html_content)
+        files = {"index.html": index_html}
+        files.update(assets)
+        for file_name in sorted(asset_report["files"]):
+            with open(self.asset_bundler.cache.path(file_name), "rb") as f:
+                files[f"{self.ASSET_DIR}/{file_name}"] = f.read()
+        for name in list(files):
+            if name.endswith(self.GZIP_TYPES):
+                data = files[name].encode("utf-8") if isinstance(files[name], str) else files[name]
+                files[name + ".gz"] = gzip.compress(data, compresslevel=9, mtime=0)
+        return files
+
+    def bundle_bytes(self, html_content):
+        """The complete zip bundle, cached by content hash"""
+        key = self.content_hash(html_content)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w") as bundle:
+            for name, data in self.bundle_files(html_content).items():
+                # Precompressed files gain nothing from deflating them again
+                compression = zipfile.ZIP_STORED if name.endswith(".gz") else zipfile.ZIP_DEFLATED
+                bundle.writestr(zipfile.ZipInfo(name, date_time=(1980, 1, 1, 0, 0, 0)), data, compress_type=compression)
+        data = buffer.getvalue()
+
+        with self._lock:
+            self._cache[key] = data
+            while len(self._cache) > self.cache_entries:
+                self._cache.popitem(last=False)
+        return data
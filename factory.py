@@ -8,7 +8,11 @@ class BaseModel(ABC):
 
 class BaseView(ABC):
     """Abstract base class for all views"""
-    pass
+    
+    @classmethod
+    def get_styles(cls) -> Dict[str, str]:
+        """CSS this view adds to the app stylesheet, keyed by page ("main" applies to every page)"""
+        return {}
 
 class BaseFactory(ABC):
     """Abstract base class for factories"""
@@ -23,16 +27,25 @@ class ModelFactory(BaseFactory):
     def __init__(self):
         self._models: Dict[str, Type[BaseModel]] = {}
         self._instances: Dict[str, BaseModel] = {}
+        self._transient: set = set()
     
-    def register_model(self, name: str, model_class: Type[BaseModel]):
+    def register_model(self, name: str, model_class: Type[BaseModel], singleton: bool = True):
         """Register a model class with the factory"""
         self._models[name] = model_class
+        if singleton:
+            self._transient.discard(name)
+        else:
+            self._transient.add(name)
     
     def create(self, name: str, *args, **kwargs) -> BaseModel:
         """Create a model instance by name"""
         if name not in self._models:
             raise ValueError(f"Model '{name}' not registered in factory")
         
+        # Value objects such as messages get a fresh instance every time
+        if name in self._transient:
+            return self._models[name](*args, **kwargs)
+        
         # For models that should be singletons, return existing instance
         if name in self._instances:
             return self._instances[name]
@@ -55,10 +68,13 @@ class ViewFactory(BaseFactory):
     def __init__(self):
         self._views: Dict[str, Type[BaseView]] = {}
         self._instances: Dict[str, BaseView] = {}
+        self.version = 0
     
     def register_view(self, name: str, view_class: Type[BaseView]):
         """Register a view class with the factory"""
         self._views[name] = view_class
+        # Lets anything derived from the registered views know to rebuild
+        self.version += 1
     
     def create(self, name: str, *args, **kwargs) -> BaseView:
         """Create a view instance by name"""
@@ -80,6 +96,14 @@ class ViewFactory(BaseFactory):
     def get_registered_views(self) -> list:
         """Get list of registered view names"""
         return list(self._views.keys())
+    
+    def collect_styles(self) -> Dict[str, list]:
+        """CSS contributed by every registered view, by page, in registration order"""
+        styles: Dict[str, list] = {}
+        for view_class in self._views.values():
+            for page, css in view_class.get_styles().items():
+                styles.setdefault(page, []).append(css)
+        return styles
 
 class AppFactory:
     """Main factory that coordinates model and view factories"""
@@ -92,19 +116,46 @@ class AppFactory:
     def _register_default_components(self):
         """Register default models and views"""
         # Import here to avoid circular imports
-        from models import Message, ChatSession, HTMLGenerator, FileManager
-        from views import CSSStyles, ChatView, ResultsView, PublishedView, FooterView
+        from models import Message, ChatSession, HTMLGenerator, FileManager, ContextBuilder
+        from session_store import SessionStore
+        from shared_cache import SharedResponseCache, SharedRateLimiter
+        from exporter import SiteExporter
+        from assets import AssetBundler
+        from publisher import StaticPublisher
+        from preview import PreviewPatcher
+        from jobs import JobExecutor
+        from profiling import RerunProfiler
+        from stylesheet import StyleBundle
+        from optimizer import HTMLOptimizer
+        from section_index import SectionIndexer
+        from speculation import SpeculativeEditor
+        from views import CSSStyles, ChatView, ResultsView, LivePreviewView, PublishedView, FooterView
         
         # Register models
-        self.model_factory.register_model("Message", Message)
-        self.model_factory.register_model("ChatSession", ChatSession)
+        self.model_factory.register_model("Message", Message, singleton=False)
+        self.model_factory.register_model("ChatSession", ChatSession, singleton=False)
         self.model_factory.register_model("HTMLGenerator", HTMLGenerator)
         self.model_factory.register_model("FileManager", FileManager)
+        self.model_factory.register_model("ContextBuilder", ContextBuilder)
+        self.model_factory.register_model("SessionStore", SessionStore)
+        self.model_factory.register_model("SharedResponseCache", SharedResponseCache)
+        self.model_factory.register_model("SharedRateLimiter", SharedRateLimiter)
+        self.model_factory.register_model("SiteExporter", SiteExporter)
+        self.model_factory.register_model("AssetBundler", AssetBundler)
+        self.model_factory.register_model("StaticPublisher", StaticPublisher)
+        self.model_factory.register_model("PreviewPatcher", PreviewPatcher)
+        self.model_factory.register_model("JobExecutor", JobExecutor)
+        self.model_factory.register_model("RerunProfiler", RerunProfiler)
+        self.model_factory.register_model("StyleBundle", StyleBundle)
+        self.model_factory.register_model("HTMLOptimizer", HTMLOptimizer)
+        self.model_factory.register_model("SectionIndexer", SectionIndexer)
+        self.model_factory.register_model("SpeculativeEditor", SpeculativeEditor)
         
         # Register views
         self.view_factory.register_view("CSSStyles", CSSStyles)
         self.view_factory.register_view("ChatView", ChatView)
         self.view_factory.register_view("ResultsView", ResultsView)
+        self.view_factory.register_view("LivePreviewView", LivePreviewView)
         self.view_factory.register_view("PublishedView", PublishedView)
         self.view_factory.register_view("FooterView", FooterView)
     
@@ -116,9 +167,9 @@ class AppFactory:
         """Create a view instance"""
         return self.view_factory.create(name, *args, **kwargs)
     
-    def register_custom_model(self, name: str, model_class: Type[BaseModel]):
+    def register_custom_model(self, name: str, model_class: Type[BaseModel], singleton: bool = True):
         """Register a custom model class"""
-        self.model_factory.register_model(name, model_class)
+        self.model_factory.register_model(name, model_class, singleton)
     
     def register_custom_view(self, name: str, view_class: Type[BaseView]):
         """Register a custom view class"""
@@ -0,0 +1,143 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import settings
+from factory import BaseModel
+
+class GenerationJob:
+    """One background generation and everything the UI needs to follow it"""
+
+    ACTIVE = ("queued", "running")
+
+    def __init__(self, session_id, kind, prompt):
+        self.job_id = uuid.uuid4().hex
+        self.session_id = session_id
+        self.kind = kind
+        self.prompt = prompt
+        self.status = "queued"
+        self.result = None
+        self.error = None
+        self.partial_chars = 0
+        self.partial_parts = []
+        self.created_at = time.monotonic()
+        self.finished_at = None
+        self.last_polled = self.created_at
+        self.cancel_event = threading.Event()
+
+    @property
+    def active(self):
+        return self.status in self.ACTIVE
+
+    @property
+    def partial_text(self):
+        """Everything streamed so far, e.g. for rendering the page as it is written"""
+        return "".join(self.partial_parts)
+
+class JobExecutor(BaseModel):
+    """Runs generations off the script thread, with polling and real cancellation"""
+
+    def __init__(self, max_workers=None, abandon_after=None, retain_for=None):
+        self.abandon_after = abandon_after or settings.JOB_ABANDON_SECONDS
+        self.retain_for = retain_for or settings.JOB_RETAIN_SECONDS
+        self._pool = ThreadPoolExecutor(max_workers=max_workers or settings.JOB_WORKERS, thread_name_prefix="generation")
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._active_by_session = {}
+        self._reaper = threading.Thread(target=self._reap_forever, name="job-reaper", daemon=True)
+        self._reaper.start()
+
+    def submit(self, session_id, kind, prompt, task):
+        """Queue task(cancel_event, on_chunk) -> (html, error); supersedes the session's previous job
+
+        on_chunk receives each newly streamed piece of text, not the whole
+        response so far.
+        """
+        job = GenerationJob(session_id, kind, prompt)
+        with self._lock:
+            previous = self._jobs.get(self._active_by_session.get(session_id))
+            if previous is not None and previous.active:
+                self._cancel(previous, "Superseded by a newer request")
+            self._jobs[job.job_id] = job
+            self._active_by_session[session_id] = job.job_id
+        self._pool.submit(self._run, job, task)
+        return job.job_id
+
+    def _run(self, job, task):
+        if job.cancel_event.is_set():
+            return
+        job.status = "running"
+
+        def on_chunk(delta):
+            job.partial_parts.append(delta)
+            job.partial_chars += len(delta)
+
+        try:
+            result, error = task(job.cancel_event, on_chunk)
+        except Exception as e:
+            result, error = None, str(e)
+        with self._lock:
+            if job.cancel_event.is_set():
+                job.status = "cancelled"
+            elif result:
+                job.status = "done"
+                job.result = result
+            else:
+                job.status = "failed"
+                job.error = error
+            job.finished_at = time.monotonic()
+
+    def get(self, job_id):
+        """Return a job and mark it as still being watched"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.last_polled = time.monotonic()
+            return job
+
+    def _cancel(self, job, reason):
+        job.error = reason
+        job.cancel_event.set()
+        if job.status == "queued":
+            job.status = "cancelled"
+            job.finished_at = time.monotonic()
+
+    def cancel(self, job_id, reason="Cancelled"):
+        """Cancel a job; a running upstream stream is closed at the next chunk"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job.active:
+                self._cancel(job, reason)
+
+    def forget(self, job_id):
+        """Drop a job once its result has been picked up"""
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+            if job is not None and self._active_by_session.get(job.session_id) == job_id:
+                del self._active_by_session[job.session_id]
+
+    def reap(self):
+        """Cancel jobs nobody is polling any more and drop old finished ones"""
+        now = time.monotonic()
+        with self._lock:
+            for job in list(self._jobs.values()):
+                if job.active and now - job.last_polled > self.abandon_after:
+                    self._cancel(job, "Abandoned")
+                elif not job.active and job.finished_at and now - job.finished_at > self.retain_for:
+                    del self._jobs[job.job_id]
+                    if self._active_by_session.get(job.session_id) == job.job_id:
+                        del self._active_by_session[job.session_id]
+
+    def _reap_forever(self):
+        while True:
+            time.sleep(max(1.0, self.abandon_after / 3))
+            self.reap()
+
+    def get_metrics(self):
+        """Counts of jobs by status"""
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+            return counts
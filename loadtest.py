@@ -0,0 +1,253 @@
+"""
+Concurrent-session load generator
+
+Drives simulated users through the real streamlit_app.py flow (chat ->
+generate -> results -> continue chat -> publish) in this process, against
+the stub LLM backend (stub_llm.py), and ramps concurrency up stage by
+stage. For each stage it reports rerun latency percentiles, throughput,
+generation time, memory growth and error rate.
+
+    python loadtest.py --concurrency 1,2,4,8,16 --latency 1.5
+    python loadtest.py --concurrency 8 --max-p99-ms 500 --max-error-rate 0.01
+
+Sessions are run with streamlit.testing's AppTest, one script run per
+simulated rerun, so shared models (caches, stores, job workers) are
+exercised exactly as a single Streamlit worker would share them. Job
+polling is simulated with full reruns every --poll seconds; in a browser
+only the status fragment reruns, so polling reruns here are pessimistic.
+Exits non-zero when a stage breaks --max-p99-ms or --max-error-rate.
+"""
+import argparse
+import gc
+import json
+import logging
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "streamlit_app.py")
+
+def percentile(values, pct):
+    """Nearest-rank percentile; 0.0 for no values"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, int(round(pct / 100.0 * len(ordered))))
+    return ordered[min(rank, len(ordered)) - 1]
+
+def resident_bytes():
+    """Current resident set size of this process"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        # Peak rather than current RSS, but still shows growth between stages
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def pin_test_runtime():
+    """Keep AppTest's stand-in Runtime visible to every concurrent session
+
+    AppTest installs a fake Runtime singleton for the length of one run and
+    clears it afterwards, which breaks other sessions' runs that are still
+    in flight. Once one exists, keep serving the most recent one.
+    """
+    from streamlit.runtime.runtime import Runtime
+
+    pinned = {}
+
+    def instance(cls):
+        if cls._instance is not None:
+            pinned["runtime"] = cls._instance
+        if "runtime" not in pinned:
+            raise RuntimeError("Runtime hasn't been created!")
+        return pinned["runtime"]
+
+    def exists(cls):
+        return cls._instance is not None or "runtime" in pinned
+
+    Runtime.instance = classmethod(instance)
+    Runtime.exists = classmethod(exists)
+
+class SimulatedSession:
+    """One user clicking through the app; every rerun is timed"""
+
+    def __init__(self, stage, user, flow, args):
+        self.label = f"user {user} flow {flow}"
+        # Unique per session so the shared response cache cannot short-circuit it
+        self.prompt = f"Landing page for bakery {stage}-{user}-{flow}"
+        self.args = args
+        self.reruns = []
+        self.generations = []
+        self.error = None
+
+    def _run(self, at):
+        start = time.perf_counter()
+        at.run()
+        self.reruns.append(time.perf_counter() - start)
+        if at.exception:
+            raise RuntimeError(at.exception[0].message)
+
+    @staticmethod
+    def _expect_button(at, key, page):
+        """Fail with whatever the app showed instead if a page's button is missing"""
+        try:
+            return at.button(key=key)
+        except KeyError:
+            shown = [element.value for element in at.error] or [button.key for button in at.button]
+            raise AssertionError(f"not on the {page} page: {shown}") from None
+
+    def _await_job(self, at):
+        start = time.perf_counter()
+        deadline = start + self.args.timeout
+        while "active_job_id" in at.session_state:
+            if time.perf_counter() > deadline:
+                raise TimeoutError("generation did not finish in time")
+            time.sleep(self.args.poll)
+            self._run(at)
+        self.generations.append(time.perf_counter() - start)
+
+    def run(self):
+        from streamlit.testing.v1 import AppTest
+
+        try:
+            at = AppTest.from_file(APP_PATH, default_timeout=self.args.timeout)
+            self._run(at)
+
+            # Chat -> generate -> results
+            at.text_input(key="chat_input").input(self.prompt)
+            at.button(key="submit_button").click()
+            self._run(at)
+            self._await_job(at)
+            self._expect_button(at, "publish_button", "results")
+
+            # Continue the chat from the results page
+            at.text_input(key="continue_chat_input").input("Make the header darker and add a contact form")
+            at.button(key="continue_button").click()
+            self._run(at)
+            self._await_job(at)
+
+            # Publish
+            self._expect_button(at, "publish_button", "results").click()
+            self._run(at)
+            self._expect_button(at, "back_to_editor", "published")
+        except Exception as e:
+            self.error = f"{self.label}: {type(e).__name__}: {e}"
+
+def run_stage(stage, users, args):
+    """Run `users` simulated users concurrently; each runs --flows flows in sequence"""
+    sessions = []
+    lock = threading.Lock()
+
+    def user_loop(user):
+        for flow in range(args.flows):
+            session = SimulatedSession(stage, user, flow, args)
+            session.run()
+            with lock:
+                sessions.append(session)
+
+    gc.collect()
+    rss_before = resident_bytes()
+    start = time.perf_counter()
+    threads = [threading.Thread(target=user_loop, args=(user,), daemon=True) for user in range(users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    rss_after = resident_bytes()
+
+    reruns = [duration for session in sessions for duration in session.reruns]
+    generations = [duration for session in sessions for duration in session.generations]
+    errors = [session.error for session in sessions if session.error]
+    return {
+        "users": users,
+        "flows": len(sessions),
+        "errors": len(errors),
+        "error_rate": len(errors) / len(sessions) if sessions else 0.0,
+        "reruns": len(reruns),
+        "reruns_per_second": len(reruns) / elapsed if elapsed else 0.0,
+        "flows_per_minute": 60.0 * (len(sessions) - len(errors)) / elapsed if elapsed else 0.0,
+        "rerun_ms": {f"p{pct}": 1000 * percentile(reruns, pct) for pct in (50, 90, 95, 99)},
+        "rerun_max_ms": 1000 * max(reruns, default=0.0),
+        "generation_s": {f"p{pct}": percentile(generations, pct) for pct in (50, 95)},
+        "rss_mb": rss_after / 2 ** 20,
+        "rss_growth_mb": (rss_after - rss_before) / 2 ** 20,
+        "elapsed_s": elapsed,
+        "sample_errors": errors[:5],
+    }
+
+def print_stage(stage):
+    rerun = stage["rerun_ms"]
+    print(
+        f"{stage['users']:>5} {stage['flows']:>6} {100 * stage['error_rate']:>6.1f}% "
+        f"{stage['reruns_per_second']:>8.1f} {stage['flows_per_minute']:>8.1f} "
+        f"{rerun['p50']:>8.1f} {rerun['p90']:>8.1f} {rerun['p99']:>8.1f} "
+        f"{stage['generation_s']['p50']:>7.2f} {stage['rss_mb']:>8.1f} {stage['rss_growth_mb']:>+8.1f}"
+    )
+    for error in stage["sample_errors"]:
+        print(f"      ! {error}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Ramp simulated sessions through the app against a stub LLM")
+    parser.add_argument("--concurrency", default="1,2,4,8", help="comma-separated concurrent users per stage")
+    parser.add_argument("--flows", type=int, default=1, help="flows each user runs per stage")
+    parser.add_argument("--latency", type=float, default=1.0, help="stub LLM seconds to first token")
+    parser.add_argument("--chunk-seconds", type=float, default=0.01, help="stub LLM delay between streamed chunks")
+    parser.add_argument("--poll", type=float, default=0.5, help="seconds between job status reruns")
+    parser.add_argument("--timeout", type=float, default=60.0, help="seconds before a rerun or generation counts as failed")
+    parser.add_argument("--data-dir", help="data directory (default: a fresh temporary directory)")
+    parser.add_argument("--json", dest="json_path", help="also write the results to this file")
+    parser.add_argument("--max-p99-ms", type=float, help="fail if any stage's p99 rerun latency exceeds this")
+    parser.add_argument("--max-error-rate", type=float, help="fail if any stage's error rate exceeds this")
+    args = parser.parse_args()
+
+    # Settings are read at import time, so configure the app before importing it
+    os.environ["WEB_GEN_LLM_BACKEND"] = "stub"
+    os.environ["WEB_GEN_STUB_LLM_LATENCY"] = str(args.latency)
+    os.environ["WEB_GEN_STUB_LLM_CHUNK_SECONDS"] = str(args.chunk_seconds)
+    os.environ["WEB_GEN_OPEN_IN_BROWSER"] = "0"
+    os.environ["WEB_GEN_DATA_DIR"] = args.data_dir or tempfile.mkdtemp(prefix="web_gen_load_")
+    # Measure the app, not the provider quota, unless asked to
+    os.environ.setdefault("WEB_GEN_TOKENS_PER_MINUTE", "100000000")
+    sys.path.insert(0, os.path.dirname(APP_PATH))
+    pin_test_runtime()
+
+    # Per-rerun warnings would drown the report
+    logging.disable(logging.WARNING)
+
+    stages = [int(users) for users in args.concurrency.split(",") if users.strip()]
+    print(f"Data directory {os.environ['WEB_GEN_DATA_DIR']}, stub latency {args.latency}s")
+    # Imports and first-use caches should not count as growth in the first stage
+    warmup = SimulatedSession("warmup", 0, 0, args)
+    warmup.run()
+    if warmup.error:
+        print(f"Warm-up flow failed: {warmup.error}")
+        return 1
+
+    print(f"{'users':>5} {'flows':>6} {'errors':>7} {'rerun/s':>8} {'flow/min':>8} "
+          f"{'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'gen p50':>7} {'rss MB':>8} {'ΔMB':>8}")
+
+    results = []
+    failed = False
+    for index, users in enumerate(stages):
+        stage = run_stage(index, users, args)
+        results.append(stage)
+        print_stage(stage)
+        if args.max_p99_ms is not None and stage["rerun_ms"]["p99"] > args.max_p99_ms:
+            print(f"      ! p99 rerun latency above {args.max_p99_ms:g} ms")
+            failed = True
+        if args.max_error_rate is not None and stage["error_rate"] > args.max_error_rate:
+            print(f"      ! error rate above {args.max_error_rate:g}")
+            failed = True
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "stages": results}, f, indent=1)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,130 @@
+import threading
+from collections import OrderedDict
+
+import settings
+from factory import BaseModel
+
+class MemoryBudget(BaseModel):
+    """Tracks resident payload sizes against per-session and per-process budgets"""
+
+    def __init__(self, session_bytes=None, process_bytes=None):
+        self.session_bytes = session_bytes or settings.SESSION_MEMORY_BUDGET
+        self.process_bytes = process_bytes or settings.PROCESS_MEMORY_BUDGET
+        self._lock = threading.RLock()
+        # Payloads in least-recently-used order, and which session uses them
+        self._payloads = OrderedDict()
+        self._sessions = {}
+        self.total_bytes = 0
+        self.peak_bytes = 0
+        self.evictions = 0
+        self.evicted_bytes = 0
+        self.spills = 0
+        self.spilled_bytes = 0
+
+    @staticmethod
+    def measure(payload):
+        """Size of a payload in bytes as it would be held or sent"""
+        if payload is None:
+            return 0
+        if isinstance(payload, bytes):
+            return len(payload)
+        return len(payload.encode("utf-8"))
+
+    def track(self, key, nbytes, session_id=None):
+        """Record a resident payload, or refresh it if already tracked"""
+        with self._lock:
+            if key in self._payloads:
+                self._payloads.move_to_end(key)
+            else:
+                self._payloads[key] = nbytes
+                self.total_bytes += nbytes
+                self.peak_bytes = max(self.peak_bytes, self.total_bytes)
+            if session_id is not None:
+                owned = self._sessions.setdefault(session_id, OrderedDict())
+                owned[key] = nbytes
+                owned.move_to_end(key)
+
+    def forget(self, key, evicted=True):
+        """Stop tracking a payload once its owner has released it"""
+        with self._lock:
+            nbytes = self._payloads.pop(key, None)
+            if nbytes is None:
+                return
+            self.total_bytes -= nbytes
+            if evicted:
+                self.evictions += 1
+                self.evicted_bytes += nbytes
+            for session_id in list(self._sessions):
+                owned = self._sessions[session_id]
+                owned.pop(key, None)
+                if not owned:
+                    del self._sessions[session_id]
+
+    def record_spill(self, nbytes):
+        """Count a payload that was moved out of memory into storage"""
+        with self._lock:
+            self.spills += 1
+            self.spilled_bytes += nbytes
+
+    def session_usage(self, session_id):
+        """Bytes currently attributed to a session"""
+        with self._lock:
+            return sum(self._sessions.get(session_id, {}).values())
+
+    def session_overflow(self, session_id, pinned=()):
+        """Keys to evict, oldest first, to bring a session back under budget
+
+        Payloads are shared by content (one HTML body can be the page of
+        several sessions), so a key another session also holds is only
+        released from this session's account, never returned for eviction.
+        """
+        with self._lock:
+            owned = self._sessions.get(session_id, {})
+            excess = sum(owned.values()) - self.session_bytes
+            victims = []
+            for key, nbytes in list(owned.items()):
+                if excess <= 0:
+                    break
+                if key in pinned:
+                    continue
+                if any(key in other for other_id, other in self._sessions.items() if other_id != session_id):
+                    del owned[key]
+                else:
+                    victims.append(key)
+                excess -= nbytes
+            if not owned:
+                self._sessions.pop(session_id, None)
+            return victims
+
+    def process_overflow(self, pinned=()):
+        """Keys to evict, least recently used first, to bring the process back under budget"""
+        with self._lock:
+            excess = self.total_bytes - self.process_bytes
+            victims = []
+            for key, nbytes in self._payloads.items():
+                if excess <= 0:
+                    break
+                if key in pinned:
+                    continue
+                victims.append(key)
+                excess -= nbytes
+            return victims
+
+    def metrics(self):
+        """Snapshot of memory pressure for monitoring"""
+        with self._lock:
+            largest = max((sum(owned.values()) for owned in self._sessions.values()), default=0)
+            return {
+                "resident_bytes": self.total_bytes,
+                "peak_bytes": self.peak_bytes,
+                "process_budget_bytes": self.process_bytes,
+                "session_budget_bytes": self.session_bytes,
+                "pressure": self.total_bytes / self.process_bytes if self.process_bytes else 0.0,
+                "tracked_payloads": len(self._payloads),
+                "tracked_sessions": len(self._sessions),
+                "largest_session_bytes": largest,
+                "evictions": self.evictions,
+                "evicted_bytes": self.evicted_bytes,
+                "spills": self.spills,
+                "spilled_bytes": self.spilled_bytes,
+            }
@@ -0,0 +1,168 @@
+"""Small, dependency-free minifiers for the CSS and JavaScript the model writes"""
+import re
+
+# Strings and comments in one pass, so a "/*" inside a string is not a comment
+_CSS_TOKEN = re.compile(r""""(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*'|/\*.*?\*/""", re.S)
+_CSS_STRING_SLOT = re.compile(r"\x00(\d+)\x00")
+_CSS_SPACE = re.compile(r"\s+")
+_CSS_PUNCT = re.compile(r"\s*([{};,>])\s*")
+# Only the space after a colon is safe to drop; "a :hover" is a descendant selector
+_CSS_COLON = re.compile(r":\s+")
+
+_JS_WORD = re.compile(r"[\w$]+")
+# A "/" after one of these starts a regex literal rather than a division
+_JS_REGEX_AFTER = set("(,=:[!&|?{};+-*%<>~^")
+_JS_REGEX_KEYWORDS = {
+    "return", "typeof", "instanceof", "in", "of", "new", "delete", "void",
+    "throw", "case", "do", "else", "yield", "await",
+}
+
+def minify_css(css):
+    """Strip comments and redundant whitespace from a stylesheet
+
+    Quoted strings are set aside first and put back unchanged.
+    """
+    strings = []
+
+    def set_aside(match):
+        token = match.group(0)
+        if token.startswith("/*"):
+            return ""
+        strings.append(token)
+        return f"\x00{len(strings) - 1}\x00"
+
+    css = _CSS_TOKEN.sub(set_aside, css)
+    css = _CSS_SPACE.sub(" ", css)
+    css = _CSS_PUNCT.sub(r"\1", css)
+    css = _CSS_COLON.sub(":", css)
+    css = css.replace(";}", "}")
+    return _CSS_STRING_SLOT.sub(lambda match: strings[int(match.group(1))], css.strip())
+
+def _js_string_end(js, start):
+    """Index just past the quoted string starting at start"""
+    quote = js[start]
+    i = start + 1
+    while i < len(js):
+        if js[i] == "\\":
+            i += 2
+            continue
+        if js[i] == quote or js[i] == "\n":
+            return i + 1
+        i += 1
+    return len(js)
+
+def _js_template_end(js, start):
+    """Scan a template literal body from start: (index past it, True if it closed rather than opened ${)"""
+    i = start
+    while i < len(js):
+        if js[i] == "\\":
+            i += 2
+            continue
+        if js[i] == "`":
+            return i + 1, True
+        if js.startswith("${", i):
+            return i + 2, False
+        i += 1
+    return len(js), True
+
+def _js_regex_end(js, start):
+    """Index just past the regex literal starting at start, or None if it is not one"""
+    i = start + 1
+    in_class = False
+    while i < len(js):
+        char = js[i]
+        if char == "\\":
+            i += 2
+            continue
+        if char == "\n":
+            return None
+        if char == "[":
+            in_class = True
+        elif char == "]":
+            in_class = False
+        elif char == "/" and not in_class:
+            match = _JS_WORD.match(js, i + 1)
+            return match.end() if match else i + 1
+        i += 1
+    return None
+
+def minify_js(js):
+    """Drop comments, indentation and blank lines from a script
+
+    This deliberately stops short of a real JavaScript minifier: line
+    breaks are kept so automatic semicolon insertion still works. Strings,
+    template literals and regex literals are copied through untouched, so
+    "/*" or "//" inside them is never taken for a comment.
+    """
+    lines = []
+    line = []
+    templates = []  # brace depth at which each open ${ of a template literal closes
+    depth = 0
+    previous = ""  # last significant token, to tell a regex literal from a division
+    i = 0
+
+    def end_line():
+        text = "".join(line).rstrip()
+        if text:
+            lines.append(text)
+        line.clear()
+
+    while i < len(js):
+        char = js[i]
+        if char in "\r\n":
+            end_line()
+            i += 1
+        elif char in " \t\f\v":
+            if line:
+                line.append(char)
+            i += 1
+        elif js.startswith("//", i):
+            newline = js.find("\n", i)
+            i = newline if newline >= 0 else len(js)
+        elif js.startswith("/*", i):
+            close = js.find("*/", i + 2)
+            end = close + 2 if close >= 0 else len(js)
+            if "\n" in js[i:end]:
+                end_line()
+            elif line and not line[-1][-1].isspace():
+                # A comment still separates the tokens around it
+                line.append(" ")
+            i = end
+        elif char in "'\"":
+            end = _js_string_end(js, i)
+            line.append(js[i:end])
+            previous = char
+            i = end
+        elif char == "`" or (char == "}" and templates and depth - 1 == templates[-1]):
+            if char == "}":
+                depth -= 1
+                templates.pop()
+            end, closed = _js_template_end(js, i + 1)
+            if not closed:
+                templates.append(depth)
+                depth += 1
+            line.append(js[i:end])
+            previous = "`"
+            i = end
+        elif char == "/" and (not previous or previous in _JS_REGEX_AFTER or previous in _JS_REGEX_KEYWORDS):
+            end = _js_regex_end(js, i)
+            if end is None:
+                line.append(char)
+                previous = char
+                i += 1
+            else:
+                line.append(js[i:end])
+                previous = "/regex/"
+                i = end
+        else:
+            match = _JS_WORD.match(js, i)
+            token = match.group(0) if match else char
+            if token == "{":
+                depth += 1
+            elif token == "}":
+                depth -= 1
+            line.append(token)
+            previous = token
+            i += len(token)
+    end_line()
+    return "\n".join(lines)
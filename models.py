@@ -1,20 +1,48 @@
 import os
+import re
 import tempfile
 import webbrowser
 from datetime import datetime
 import groq
 import streamlit as st
 
+import settings
 from factory import BaseModel
+from shared_cache import SharedRateLimiter, SharedResponseCache
 
 class Message(BaseModel):
     """Represents a chat message"""
-    def __init__(self, role, content, personality=None, html_content=None):
+    def __init__(self, role, content, personality=None, html_content=None, timestamp=None):
         self.role = role
         self.content = content
-        self.timestamp = datetime.now().strftime("%H:%M")
+        self.timestamp = timestamp or datetime.now().strftime("%H:%M")
         self.personality = personality
-        self.html_content = html_content
+        self._html_content = html_content
+        self.html_ref = None
+        self.html_loader = None
+    
+    @property
+    def html_content(self):
+        """HTML attached to the message, loaded from storage on demand"""
+        if self._html_content is None and self.html_ref and self.html_loader:
+            return self.html_loader(self.html_ref)
+        return self._html_content
+    
+    @html_content.setter
+    def html_content(self, value):
+        self._html_content = value
+        self.html_ref = None
+    
+    @property
+    def has_html(self):
+        """Whether HTML is attached, without loading it"""
+        return self._html_content is not None or self.html_ref is not None
+    
+    def attach_html(self, html_ref, html_loader):
+        """Drop the in-memory HTML in favour of a stored reference"""
+        self._html_content = None
+        self.html_ref = html_ref
+        self.html_loader = html_loader
     
     def to_dict(self):
         return {
@@ -27,18 +55,49 @@ class Message(BaseModel):
 
 class ChatSession(BaseModel):
     """Manages chat session state"""
-    def __init__(self):
+    def __init__(self, store=None, session_id=None):
         self.messages = []
         self.current_personality = "HTML Generator"
         self.generated_html = None
         self.html_file_path = None
         self.show_results = False
-        self.current_html = None
+        self._current_html = None
+        self.current_html_ref = None
+        self.html_loader = None
         self.show_published = False
+        # Public id of the published site; never the session id, which
+        # grants editing access to whoever has it
+        self.site_id = None
+        # Row version and saved fields last read or written, so the store can
+        # tell when another worker changed the session in the meantime
+        self.version = 0
+        self.stored_state = {}
+        self.store = store
+        self.session_id = session_id
+    
+    @property
+    def current_html(self):
+        """Latest generated HTML, loaded from storage on demand"""
+        if self._current_html is None and self.current_html_ref and self.html_loader:
+            return self.html_loader(self.current_html_ref)
+        return self._current_html
+    
+    @current_html.setter
+    def current_html(self, value):
+        self._current_html = value
+        self.current_html_ref = None
+    
+    def attach_current_html(self, html_ref, html_loader):
+        """Drop the in-memory current HTML in favour of a stored reference"""
+        self._current_html = None
+        self.current_html_ref = html_ref
+        self.html_loader = html_loader
     
     def add_message(self, message):
         """Add a message to the chat history"""
         self.messages.append(message)
+        if self.store:
+            self.store.append_message(self.session_id, message)
     
     def get_messages(self):
         """Get all messages"""
@@ -47,6 +106,170 @@ class ChatSession(BaseModel):
     def clear_messages(self):
         """Clear all messages"""
         self.messages = []
+        if self.store:
+            self.store.clear_messages(self.session_id)
+    
+    def save(self):
+        """Persist the session state if it is backed by a store"""
+        if self.store:
+            self.store.save_state(self)
+
+class ContextBuilder(BaseModel):
+    """Builds a token-bounded prompt from the chat history and current HTML"""
+    
+    # Rough local tokenizer: words, numbers and single punctuation marks.
+    # BPE tokenizers land close to this count for prose and markup, but
+    # split dense text (base64, hashes, minified code) much finer, so the
+    # estimate is never less than one token per three characters.
+    TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+    CHARS_PER_TOKEN = 3
+    OUTLINE_PATTERN = re.compile(
+        r"<(title|h[1-3]|section|header|nav|footer|form)\b([^>]*)>(.*?)(?=<|$)", re.I | re.S
+    )
+    
+    def __init__(self, token_budget=3500, history_tokens=500, summary_tokens=150, max_recent_turns=6):
+        self.token_budget = token_budget
+        self.history_tokens = history_tokens
+        self.summary_tokens = summary_tokens
+        self.max_recent_turns = max_recent_turns
+    
+    def estimate_tokens(self, text):
+        """Estimate the number of tokens in a piece of text"""
+        if not text:
+            return 0
+        return max(len(self.TOKEN_PATTERN.findall(text)), len(text) // self.CHARS_PER_TOKEN)
+    
+    def _message_tokens(self, message):
+        # Every chat message carries a few tokens of role/framing overhead
+        return self.estimate_tokens(message["content"]) + 4
+    
+    def _truncate(self, text, max_tokens):
+        """Cut text down to roughly max_tokens, keeping its head and tail"""
+        if max_tokens <= 0:
+            return ""
+        if self.estimate_tokens(text) <= max_tokens:
+            return text
+        ratio = len(text) / max(self.estimate_tokens(text), 1)
+        keep = int(max_tokens * ratio / 2)
+        return f"{text[:keep]}\n<!-- ... truncated ... -->\n{text[-keep:]}"
+    
+    @staticmethod
+    def _normalize(text):
+        return " ".join(text.lower().split())
+    
+    def _summarize(self, turns):
+        """Collapse older user turns into a single short summary line"""
+        requests = [turn["content"] for turn in turns if turn["role"] == "user"]
+        if not requests:
+            return None
+        summary = "Earlier requests in this conversation: " + "; ".join(requests)
+        return self._truncate(summary, self.summary_tokens)
+    
+    def _outline(self, html_content, max_tokens):
+        """Title, headings and section ids of a page, for rebuilding it without the markup"""
+        lines = []
+        for tag, attrs, text in self.OUTLINE_PATTERN.findall(html_content):
+            tag = tag.lower()
+            text = " ".join(re.sub(r"<[^>]+>", " ", text).split())
+            section_id = re.search(r"""\bid\s*=\s*["']([^"']+)["']""", attrs)
+            if tag in ("section", "header", "nav", "footer", "form"):
+                lines.append(f"<{tag}" + (f' id="{section_id.group(1)}"' if section_id else "") + ">")
+            elif text:
+                lines.append(f"{tag}: {text[:80]}")
+        return self._truncate("\n".join(lines), max_tokens)
+    
+    def build_messages(self, system_prompt, history, prompt, current_html=None):
+        """Build the chat messages for a follow-up request within the token budget
+
+        A page too large to send whole is never cut: a truncated page cannot
+        be returned complete. The model rebuilds it instead from the
+        conversation and an outline of the current version.
+        """
+        system_message = {"role": "system", "content": system_prompt}
+        if current_html:
+            instruction = (
+                f"Update the website above according to this request: {prompt}\n"
+                "Return the complete updated HTML document."
+            )
+        else:
+            instruction = f"Create a complete HTML website for: {prompt}"
+        user_message = {"role": "user", "content": instruction}
+        
+        remaining = self.token_budget - self._message_tokens(system_message) - self._message_tokens(user_message)
+        
+        # The current HTML goes in exactly once; older versions stored on the
+        # messages are never sent. It gets priority over the chat history.
+        html_message = None
+        if current_html:
+            html_message = {"role": "assistant", "content": f"Current website HTML:\n```html\n{current_html}\n```"}
+            if self._message_tokens(html_message) > remaining - self.history_tokens:
+                user_message["content"] = (
+                    "Recreate the website from this conversation, keeping the structure outlined above, "
+                    f"and apply this request: {prompt}\n"
+                    "Return the complete updated HTML document."
+                )
+                remaining = self.token_budget - self._message_tokens(system_message) - self._message_tokens(user_message)
+                outline = self._outline(current_html, (remaining - self.history_tokens) // 2)
+                html_message = {"role": "assistant", "content": (
+                    "The current website is too large to include here. Its outline:\n" + outline
+                )}
+            remaining -= self._message_tokens(html_message)
+        
+        return self._assemble(system_message, history, prompt, remaining, html_message, user_message)
+    
+    def build_edit_messages(self, system_prompt, history, prompt, fragment, css="", label=None):
+        """Build the chat messages for an edit to one element of the page"""
+        system_message = {"role": "system", "content": system_prompt}
+        target = label or "this part of the website"
+        user_message = {"role": "user", "content": (
+            f"Update {target} according to this request: {prompt}\n"
+            "Return only the updated element as HTML, not the whole document. "
+            "If styles need to change, follow the element with one <style> block "
+            "containing just the new or changed CSS rules."
+        )}
+        
+        remaining = self.token_budget - self._message_tokens(system_message) - self._message_tokens(user_message)
+        
+        # Only the element and the CSS that applies to it are sent, so the
+        # request scales with the size of the change rather than the page
+        parts = [f"Current HTML of {target}:\n```html\n{fragment}\n```"]
+        if css:
+            parts.append(f"CSS that applies to it:\n```css\n{css}\n```")
+        # Never truncated: a cut fragment cannot be spliced back. SectionIndexer
+        # only plans edits for fragments that fit.
+        fragment_message = {"role": "assistant", "content": "\n".join(parts)}
+        remaining -= self._message_tokens(fragment_message)
+        
+        return self._assemble(system_message, history, prompt, remaining, fragment_message, user_message)
+    
+    def _assemble(self, system_message, history, prompt, remaining, context_message, user_message):
+        """Fit recent history, a summary of older turns and the page context into the budget"""
+        # Walk the history newest first, dropping repeated content and
+        # status-only replies that add nothing the model can use
+        seen = {self._normalize(prompt)}
+        recent = []
+        older = []
+        for message in reversed(history or []):
+            key = self._normalize(message.content)
+            if not key or key in seen or message.has_html:
+                continue
+            seen.add(key)
+            turn = {"role": message.role, "content": message.content}
+            if len(recent) < self.max_recent_turns and self._message_tokens(turn) <= remaining - self.summary_tokens:
+                recent.append(turn)
+                remaining -= self._message_tokens(turn)
+            else:
+                older.append(turn)
+        
+        messages = [system_message]
+        summary = self._summarize(reversed(older))
+        if summary and self.estimate_tokens(summary) + 4 <= remaining:
+            messages.append({"role": "user", "content": summary})
+        messages.extend(reversed(recent))
+        if context_message:
+            messages.append(context_message)
+        messages.append(user_message)
+        return messages
 
 class HTMLGenerator(BaseModel):
     """Handles HTML generation using Groq API"""
@@ -68,15 +291,31 @@ class HTMLGenerator(BaseModel):
             - Fonts from Google Fonts
             - Icons from Font Awesome or similar
             
-            Make the design modern, beautiful, and fully functional. Include all necessary CSS and JavaScript inline."""
+            Make the design modern, beautiful, and fully functional. Include all necessary CSS and JavaScript inline.""",
+            # Run generated pages through HTMLOptimizer (optimizer.py)
+            "optimize": True
         }
     }
     
+    MODEL = "llama3-70b-8192"
+    CONTEXT_WINDOW = 8192
+    TEMPERATURE = 0.7
+    MAX_TOKENS = 4000
+    
     def __init__(self):
         self.client = None
+        # The prompt gets whatever the model's context leaves after the reply
+        self.context_builder = ContextBuilder(token_budget=self.CONTEXT_WINDOW - self.MAX_TOKENS)
+        self.response_cache = SharedResponseCache()
+        self.rate_limiter = SharedRateLimiter()
     
     def get_groq_client(self):
         """Initialize Groq client with API key"""
+        if settings.LLM_BACKEND == "stub":
+            from stub_llm import StubLLMClient
+            self.client = StubLLMClient()
+            return self.client
+        
         api_key = st.secrets.get("GROQ_API_KEY", os.environ.get("GROQ_API_KEY"))
         if not api_key:
             raise ValueError("Groq API key not found. Please set it in Streamlit secrets or environment variables.")
@@ -87,36 +326,117 @@ class HTMLGenerator(BaseModel):
         except Exception as e:
             raise Exception(f"Error initializing Groq client: {str(e)}")
     
-    def generate_html(self, prompt, personality):
+    def generate_html(self, prompt, personality, history=None, current_html=None, cancel_event=None, on_chunk=None):
         """Generate HTML using Groq API"""
         if not self.client:
             self.get_groq_client()
         
         try:
             system_prompt = self.PERSONALITIES[personality]["system_prompt"]
-            
-            # Call Groq API
-            chat_completion = self.client.chat.completions.create(
-                messages=[
-                    {
-                        "role": "system",
-                        "content": system_prompt
-                    },
-                    {
-                        "role": "user", 
-                        "content": f"Create a complete HTML website for: {prompt}"
-                    }
-                ],
-                model="llama3-70b-8192",
-                temperature=0.7,
-                max_tokens=4000
-            )
-            
-            html_content = chat_completion.choices[0].message.content
-            return html_content, None
+            messages = self.context_builder.build_messages(system_prompt, history, prompt, current_html)
+            return self._cached_complete(messages, cancel_event, on_chunk)
             
         except Exception as e:
             return None, f"Error generating HTML: {str(e)}"
+    
+    def edit_fragment(self, prompt, personality, history, fragment, css="", label=None, cancel_event=None, on_chunk=None):
+        """Rewrite one element of the current page; returns the model's fragment output"""
+        if not self.client:
+            self.get_groq_client()
+        
+        try:
+            system_prompt = self.PERSONALITIES[personality]["system_prompt"]
+            messages = self.context_builder.build_edit_messages(system_prompt, history, prompt, fragment, css, label)
+            return self._cached_complete(messages, cancel_event, on_chunk)
+            
+        except Exception as e:
+            return None, f"Error editing HTML: {str(e)}"
+    
+    def _cached_complete(self, messages, cancel_event=None, on_chunk=None):
+        """Complete through the shared response cache"""
+        # Identical requests from any worker on this host share one upstream call
+        key = self.response_cache.make_key(
+            model=self.MODEL,
+            temperature=self.TEMPERATURE,
+            max_tokens=self.MAX_TOKENS,
+            messages=messages
+        )
+        html_content = self.response_cache.get(key)
+        if html_content is not None:
+            return html_content, None
+        
+        if not self.response_cache.claim(key):
+            html_content = self.response_cache.wait_for(key, cancel_event=cancel_event)
+            if html_content is not None:
+                return html_content, None
+            if cancel_event is not None and cancel_event.is_set():
+                return None, "Generation cancelled"
+            # Another worker still holds (or just re-took) the claim; calling
+            # upstream anyway would be the duplicate the claim prevents
+            if not self.response_cache.claim(key):
+                return None, "An identical request is still being generated, please try again in a moment."
+
+        try:
+            html_content, error = self._complete(messages, cancel_event, on_chunk)
+        except Exception:
+            self.response_cache.release(key)
+            raise
+        if html_content is None:
+            self.response_cache.release(key)
+            return None, error
+        
+        self.response_cache.put(key, html_content)
+        return html_content, None
+    
+    def _complete(self, messages, cancel_event=None, on_chunk=None):
+        """Stream a completion from the Groq API within the host-wide token budget"""
+        prompt_tokens = sum(self.context_builder.estimate_tokens(m["content"]) for m in messages)
+        estimated = prompt_tokens + self.MAX_TOKENS
+        if not self.rate_limiter.acquire(estimated, cancel_event=cancel_event):
+            if cancel_event is not None and cancel_event.is_set():
+                return None, "Generation cancelled"
+            return None, "Rate limit reached, please try again in a moment."
+        
+        parts = []
+        used = None
+        cancelled = False
+        stream = None
+        try:
+            stream = self.client.chat.completions.create(
+                messages=messages,
+                model=self.MODEL,
+                temperature=self.TEMPERATURE,
+                max_tokens=self.MAX_TOKENS,
+                stream=True
+            )
+            for chunk in stream:
+                if cancel_event is not None and cancel_event.is_set():
+                    # Closing the response aborts the upstream generation
+                    cancelled = True
+                    break
+                if chunk.choices and chunk.choices[0].delta.content:
+                    parts.append(chunk.choices[0].delta.content)
+                    if on_chunk:
+                        # Only the new text; joining everything per chunk is quadratic
+                        on_chunk(chunk.choices[0].delta.content)
+                usage = getattr(getattr(chunk, "x_groq", None), "usage", None) or getattr(chunk, "usage", None)
+                if usage is not None and usage.total_tokens:
+                    used = usage.total_tokens
+        finally:
+            try:
+                if stream is not None:
+                    stream.close()
+            finally:
+                # Hand back whatever the request did not actually use, also
+                # when the upstream call failed before or during the stream
+                if used is None:
+                    used = (prompt_tokens if stream is not None else 0) + self.context_builder.estimate_tokens("".join(parts))
+                self.rate_limiter.refund(estimated - used)
+        
+        html_content = "".join(parts)
+        if cancelled:
+            return None, "Generation cancelled"
+        return html_content, None
 
 class FileManager(BaseModel):
     """Handles file operations"""
@@ -0,0 +1,259 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+
+import settings
+from assets import AssetBundler
+from factory import BaseModel
+from minify import minify_css, minify_js
+
+class HTMLOptimizer(BaseModel):
+    """Shrinks generated pages: unused and duplicate CSS, deferred scripts, minified markup"""
+
+    STYLE_BLOCK = re.compile(r"(<style[^>]*>)(.*?)(</style>)", re.S | re.I)
+    SCRIPT_BLOCK = re.compile(r"(<script\b[^>]*>)(.*?)(</script>)", re.S | re.I)
+    HEAD = re.compile(r"<head\b[^>]*>.*?</head>", re.S | re.I)
+    BODY_END = re.compile(r"</body>", re.I)
+    PROTECTED = re.compile(r"(<(pre|textarea|script|style)\b[^>]*>)(.*?)(</\2>)", re.S | re.I)
+    COMMENT = re.compile(r"<!--(?!\[if).*?-->", re.S)
+    CSS_COMMENT = re.compile(r"/\*.*?\*/", re.S)
+    SPACE = re.compile(r"\s+")
+    # Whitespace around these tags never renders. Not script or noscript:
+    # inline in text, the space around them separates the words either side
+    QUIET_TAG = re.compile(r"\s*(<(?:!doctype|/?(?:html|head|body|meta|link|title|style|base))\b[^>]*>)\s*", re.I)
+    CLASS_ATTR = re.compile(r"""\bclass\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+))""", re.I)
+    ID_ATTR = re.compile(r"""\bid\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+))""", re.I)
+    STYLE_ATTR = re.compile(r"""\bstyle\s*=\s*(?:"([^"]*)"|'([^']*)')""", re.I)
+    # Any quoted attribute value: event handlers, javascript: URLs and data-* targets can name classes
+    ATTRIBUTE_VALUE = re.compile(r"""\b[\w:.-]+\s*=\s*(?:"([^"]*)"|'([^']*)')""")
+    TYPE_ATTR = re.compile(r"""\btype\s*=\s*["']?([^"'\s>]+)""", re.I)
+    SELECTOR_TOKEN = re.compile(r"([.#])(-?[_a-zA-Z][\w-]*)")
+    SELECTOR_ARGS = re.compile(r"\([^()]*\)|\[[^\]]*\]")
+    KEYFRAMES = re.compile(r"@(?:-\w+-)?keyframes\s+([\w-]+)", re.I)
+    GROUPING_RULES = ("@media", "@supports", "@layer", "@container", "@document")
+    JS_TYPES = ("", "text/javascript", "application/javascript", "module")
+
+    def __init__(self, cache_entries=None):
+        self.cache_entries = cache_entries or settings.OPTIMIZER_CACHE_ENTRIES
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._metrics = {"runs": 0, "cache_hits": 0, "bytes_before": 0, "bytes_after": 0}
+        self._last_report = None
+
+    @staticmethod
+    def content_hash(html_content):
+        return hashlib.sha256(html_content.encode("utf-8")).hexdigest()[:16]
+
+    def optimize(self, html_content, prune=True):
+        """Return (optimized html, report), cached by content hash
+
+        prune=False keeps every rule and keyframe whose use cannot be proven
+        from the page alone. That is the form for the stored page, which later
+        edits build on; pruning is for derived copies (publishing, export).
+        """
+        key = f"{self.content_hash(html_content)}:{int(prune)}"
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self._metrics["cache_hits"] += 1
+                optimized, report = cached
+                return optimized, dict(report, cached=True)
+
+        report = {
+            "before": len(html_content.encode("utf-8")),
+            "removed_rules": 0,
+            "duplicate_rules": 0,
+            "removed_keyframes": 0,
+            "moved_scripts": 0,
+            "deferred_scripts": 0,
+        }
+        try:
+            optimized = self._optimize_css(html_content, report, prune)
+            optimized = self._optimize_scripts(optimized, report)
+            optimized = self._minify_markup(optimized)
+        except Exception:
+            # A page the optimizer cannot make sense of is better left alone
+            optimized = html_content
+        report["after"] = len(optimized.encode("utf-8"))
+        report["cached"] = False
+
+        with self._lock:
+            self._cache[key] = (optimized, report)
+            while len(self._cache) > self.cache_entries:
+                self._cache.popitem(last=False)
+            self._metrics["runs"] += 1
+            self._metrics["bytes_before"] += report["before"]
+            self._metrics["bytes_after"] += report["after"]
+            self._last_report = report
+        return optimized, dict(report)
+
+    def get_metrics(self):
+        """Totals since startup plus the most recent report"""
+        with self._lock:
+            return dict(self._metrics, cache_entries=len(self._cache), last=self._last_report)
+
+    # CSS
+
+    @staticmethod
+    def _attribute_values(pattern, html_content):
+        return [next(group for group in match.groups() if group is not None) for match in pattern.finditer(html_content)]
+
+    def _usage(self, html_content):
+        """Classes and ids in the markup, and script text that may add more at runtime"""
+        markup = self.SCRIPT_BLOCK.sub("", self.STYLE_BLOCK.sub("", html_content))
+        classes = {token for value in self._attribute_values(self.CLASS_ATTR, markup) for token in value.split()}
+        ids = set(self._attribute_values(self.ID_ATTR, markup))
+        # Inline handlers (onclick="this.classList.toggle('open')") are scripts too
+        scripts = " ".join(
+            [match.group(2) for match in self.SCRIPT_BLOCK.finditer(html_content)]
+            + self._attribute_values(self.ATTRIBUTE_VALUE, markup)
+        )
+        inline_styles = " ".join(self._attribute_values(self.STYLE_ATTR, markup))
+        return classes, ids, scripts, inline_styles
+
+    def _selector_used(self, selector, classes, ids, scripts):
+        if "\\" in selector:
+            # Escaped class names (e.g. "md\:flex") are not worth guessing at
+            return True
+        for kind, name in self.SELECTOR_TOKEN.findall(self.SELECTOR_ARGS.sub("", selector)):
+            known = classes if kind == "." else ids
+            if name not in known and name not in scripts:
+                return False
+        return True
+
+    def _filter_rules(self, css, usage, report):
+        """Drop rules whose selectors match nothing on the page; recurse into @media and friends"""
+        classes, ids, scripts, _ = usage
+        kept = []
+        for prelude, body in AssetBundler._split_rules(css):
+            selector = prelude.strip()
+            if body is None:
+                if selector:
+                    kept.append(selector)
+                continue
+            lowered = selector.lower()
+            if lowered.startswith(self.GROUPING_RULES):
+                inner = self._filter_rules(body, usage, report)
+                if inner:
+                    kept.append(f"{selector}{{{inner}}}")
+                continue
+            if not selector.startswith("@"):
+                used = [part.strip() for part in selector.split(",") if self._selector_used(part, classes, ids, scripts)]
+                if not used:
+                    report["removed_rules"] += 1
+                    continue
+                selector = ",".join(used)
+            kept.append(f"{selector}{{{body}}}")
+        return "".join(kept)
+
+    def _optimize_css(self, html_content, report, prune=True):
+        usage = self._usage(html_content)
+        blocks = [minify_css(self._filter_rules(self.CSS_COMMENT.sub("", match.group(2)), usage, report)
+                             if prune else match.group(2))
+                  for match in self.STYLE_BLOCK.finditer(html_content)]
+
+        # Duplicates across every block, in document order
+        rules = [(index, f"{prelude}{{{body}}}" if body is not None else prelude)
+                 for index, css in enumerate(blocks)
+                 for prelude, body in AssetBundler._split_rules(css)]
+        # Identical rules only need their last copy, which is the one that wins
+        last_index = {rule: position for position, (_, rule) in enumerate(rules)}
+        report["duplicate_rules"] += len(rules) - len(last_index)
+
+        # Keyframes nothing animates with
+        _, _, scripts, inline_styles = usage
+        keyframes = {}
+        for position, (index, rule) in enumerate(rules):
+            match = self.KEYFRAMES.match(rule)
+            if match:
+                keyframes[position] = match.group(1)
+        references = " ".join(rule for position, (_, rule) in enumerate(rules) if position not in keyframes)
+        references += " " + scripts + " " + inline_styles
+
+        kept = [[] for _ in blocks]
+        for position, (index, rule) in enumerate(rules):
+            if last_index.get(rule) != position:
+                continue
+            name = keyframes.get(position)
+            if prune and name is not None and not re.search(rf"(?<![\w-]){re.escape(name)}(?![\w-])", references):
+                report["removed_keyframes"] += 1
+                continue
+            kept[index].append(rule)
+
+        replacements = iter("".join(block_rules) for block_rules in kept)
+
+        def replace(match):
+            css = next(replacements)
+            return f"{match.group(1)}{css}{match.group(3)}" if css else ""
+        return self.STYLE_BLOCK.sub(replace, html_content)
+
+    # Scripts
+
+    def _script_kind(self, open_tag):
+        """'inline', 'external' or None for non-classic scripts (JSON, templates, modules)"""
+        type_match = self.TYPE_ATTR.search(open_tag)
+        script_type = type_match.group(1).lower() if type_match else ""
+        if script_type not in self.JS_TYPES or script_type == "module":
+            return None
+        return "external" if re.search(r"\bsrc\s*=", open_tag, re.I) else "inline"
+
+    def _optimize_scripts(self, html_content, report):
+        # Minify inline JavaScript
+        def minify(match):
+            type_match = self.TYPE_ATTR.search(match.group(1))
+            if (type_match.group(1).lower() if type_match else "") not in self.JS_TYPES:
+                return match.group(0)
+            return f"{match.group(1)}{minify_js(match.group(2))}{match.group(3)}"
+        html_content = self.SCRIPT_BLOCK.sub(minify, html_content)
+
+        # Blocking scripts in <head> move down to where the body first
+        # needs scripts, keeping their order relative to everything else
+        head = self.HEAD.search(html_content)
+        if head:
+            moved = [match.group(0) for match in self.SCRIPT_BLOCK.finditer(head.group(0)) if self._script_kind(match.group(1))]
+            if moved:
+                new_head = self.SCRIPT_BLOCK.sub(
+                    lambda match: "" if self._script_kind(match.group(1)) else match.group(0),
+                    head.group(0)
+                )
+                rest = html_content[head.end():]
+                first = next((match for match in self.SCRIPT_BLOCK.finditer(rest) if self._script_kind(match.group(1))), None)
+                if first is not None:
+                    at = first.start()
+                else:
+                    body_end = self.BODY_END.search(rest)
+                    at = body_end.start() if body_end else len(rest)
+                rest = rest[:at] + "".join(moved) + rest[at:]
+                html_content = html_content[:head.start()] + new_head + rest
+                report["moved_scripts"] += len(moved)
+
+        # External scripts can be deferred as long as no inline script
+        # after them might depend on what they define
+        scripts = [(match, self._script_kind(match.group(1))) for match in self.SCRIPT_BLOCK.finditer(html_content)]
+        last_inline = max((match.start() for match, kind in scripts if kind == "inline"), default=-1)
+
+        def defer(match):
+            open_tag = match.group(1)
+            if (match.start() > last_inline
+                    and self._script_kind(open_tag) == "external"
+                    and not re.search(r"\b(?:defer|async)\b", open_tag, re.I)):
+                report["deferred_scripts"] += 1
+                return f"{open_tag[:-1]} defer>{match.group(2)}{match.group(3)}"
+            return match.group(0)
+        return self.SCRIPT_BLOCK.sub(defer, html_content)
+
+    # Markup
+
+    def _minify_markup(self, html_content):
+        protected = []
+
+        def protect(match):
+            protected.append(match.group(3))
+            return f"{match.group(1)}\x00{len(protected) - 1}\x00{match.group(4)}"
+        html_content = self.PROTECTED.sub(protect, html_content)
+        html_content = self.COMMENT.sub("", html_content)
+        html_content = self.SPACE.sub(" ", html_content)
+        html_content = self.QUIET_TAG.sub(r"\1", html_content)
+        return re.sub(r"\x00(\d+)\x00", lambda match: protected[int(match.group(1))], html_content).strip()
@@ -0,0 +1,149 @@
+import re
+from html.parser import HTMLParser
+
+from factory import BaseModel
+
+class _BodyOutline(HTMLParser):
+    """Finds the source spans of the top-level elements inside <body>"""
+
+    VOID_TAGS = {
+        "area", "base", "br", "col", "embed", "hr", "img", "input",
+        "link", "meta", "source", "track", "wbr",
+    }
+
+    def __init__(self, html_content):
+        super().__init__(convert_charrefs=False)
+        self.html_content = html_content
+        # HTMLParser counts lines by "\n" only, unlike str.splitlines()
+        self._line_offsets = [0] + [match.end() for match in re.finditer("\n", html_content)]
+        self.body_start = None
+        self.body_tag = ""
+        self.blocks = []
+        self.text = []
+        self._depth = 0
+        self._block_start = None
+        self._block_tag = None
+        self.feed(html_content)
+        self.close()
+
+    def _offset(self):
+        line, column = self.getpos()
+        return self._line_offsets[line - 1] + column
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "body":
+            self.body_start = self._offset()
+            self.body_tag = self.get_starttag_text()
+            return
+        if self.body_start is None:
+            return
+        if self._depth == 0:
+            self._block_start = self._offset()
+            self._block_tag = tag
+        if tag in self.VOID_TAGS:
+            if self._depth == 0:
+                self._end_block(self._offset() + len(self.get_starttag_text()))
+            return
+        self._depth += 1
+
+    def handle_startendtag(self, tag, attrs):
+        if self.body_start is not None and self._depth == 0:
+            self._block_start = self._offset()
+            self._block_tag = tag
+            self._end_block(self._offset() + len(self.get_starttag_text()))
+
+    def handle_endtag(self, tag):
+        if self.body_start is None or tag == "body" or tag in self.VOID_TAGS:
+            return
+        if self._depth == 0:
+            return
+        self._depth -= 1
+        if self._depth == 0:
+            end = self.html_content.find(">", self._offset()) + 1
+            self._end_block(end)
+
+    def handle_data(self, data):
+        if self.body_start is not None and self._depth == 0 and data.strip():
+            self.text.append(data.strip())
+
+    def _end_block(self, end):
+        self.blocks.append((self._block_tag, self.html_content[self._block_start:end]))
+        self._block_start = None
+
+class PreviewPatcher(BaseModel):
+    """Works out the smallest safe update that turns one preview document into another"""
+
+    STYLE_BLOCK = re.compile(r"(<style[^>]*>)(.*?)(</style>)", re.S | re.I)
+    DOCUMENT_START = re.compile(r"<!doctype\b|<html\b", re.I)
+    SCRIPT_BLOCK = re.compile(r"<script[^>]*>.*?</script>", re.S | re.I)
+    HOOKS = re.compile(r"""\b(?:id|class)\s*=\s*["']([^"']+)["']""", re.I)
+
+    def _outline(self, html_content):
+        try:
+            outline = _BodyOutline(html_content)
+        except Exception:
+            return None
+        if outline.body_start is None:
+            return None
+        styles = [match.group(2) for match in self.STYLE_BLOCK.finditer(html_content)]
+        scripts = self.SCRIPT_BLOCK.findall(html_content)
+        head = self.STYLE_BLOCK.sub(r"\1\3", html_content[:outline.body_start])
+        return {
+            "styles": styles,
+            "scripts": scripts,
+            "blocks": outline.blocks,
+            # Anything that would need a full reload to apply correctly
+            "structure": (
+                head,
+                tuple(scripts),
+                outline.body_tag,
+                tuple(tag for tag, _ in outline.blocks),
+                tuple(outline.text),
+            ),
+        }
+
+    def document_start(self, text):
+        """Offset where a streamed response starts a full HTML document, or None
+
+        Targeted edits stream a single element, which cannot be rendered on
+        its own, and some responses open with a code fence or a sentence.
+        """
+        match = self.DOCUMENT_START.search(text[:1000])
+        if match is None or "<" in text[:match.start()]:
+            return None
+        return match.start()
+
+    def append(self, text, sent):
+        """Operation writing the part of a streamed document the frame has not seen yet"""
+        start = self.document_start(text)
+        if start is None or len(text) <= sent:
+            return []
+        return [{"op": "append", "html": text[max(sent, start):], "open": sent <= start}]
+
+    def diff(self, old_html, new_html):
+        """List of patch operations, or a single reload operation"""
+        if old_html == new_html:
+            return []
+        reload = [{"op": "reload", "html": new_html}]
+        if not old_html:
+            return reload
+
+        old, new = self._outline(old_html), self._outline(new_html)
+        if old is None or new is None or old["structure"] != new["structure"]:
+            return reload
+
+        ops = []
+        if old["styles"] != new["styles"]:
+            ops.append({"op": "styles", "css": new["styles"]})
+
+        script_text = "".join(new["scripts"])
+        for index, ((tag, old_block), (_, new_block)) in enumerate(zip(old["blocks"], new["blocks"])):
+            if old_block == new_block:
+                continue
+            # Swapping markup drops event listeners that scripts attached to
+            # it, so blocks that scripts refer to need the full reload
+            hooks = {token for match in self.HOOKS.finditer(old_block + new_block) for token in match.group(1).split()}
+            if any(hook in script_text for hook in hooks):
+                return reload
+            ops.append({"op": "block", "index": index, "tag": tag, "html": new_block})
+        return ops
@@ -0,0 +1,236 @@
+"""
+On-demand profiling of Streamlit reruns
+
+Profiled reruns of AppController.run are captured with cProfile and
+tracemalloc and written to WEB_GEN_PROFILE_DIR, keeping the newest
+WEB_GEN_PROFILE_KEEP runs. A rerun is profiled when an operator switched
+its session on, either from the command line below or by opening it with
+?profile=1&admin=<WEB_GEN_ADMIN_TOKEN>, or when it is picked by
+WEB_GEN_PROFILE_SAMPLE_RATE. Visitors cannot turn profiling on themselves.
+
+    python profiling.py enable <session_id>    # switch a session on
+    python profiling.py disable <session_id>
+    python profiling.py list [--limit N]       # slowest reruns
+    python profiling.py show <run_id>          # top functions and allocators
+"""
+import argparse
+import contextlib
+import cProfile
+import json
+import os
+import pstats
+import random
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+
+import settings
+from factory import BaseModel
+
+class RerunProfiler(BaseModel):
+    """Captures per-rerun cProfile stats and tracemalloc snapshots to disk"""
+
+    ENABLED_FILE = "enabled.json"
+
+    def __init__(self, profile_dir=None, sample_rate=None, keep=None, top_n=None):
+        self.profile_dir = profile_dir or settings.PROFILE_DIR
+        self.sample_rate = settings.PROFILE_SAMPLE_RATE if sample_rate is None else sample_rate
+        self.keep = keep or settings.PROFILE_KEEP
+        self.top_n = top_n or settings.PROFILE_TOP_N
+        self._lock = threading.Lock()
+        # cProfile and tracemalloc are process-wide, so only one rerun is
+        # profiled at a time and overlapping ones are counted instead
+        self._active = False
+        self._enabled = set()
+        self._enabled_mtime = None
+        os.makedirs(self.profile_dir, exist_ok=True)
+
+    def _path(self, name):
+        return os.path.join(self.profile_dir, name)
+
+    def _write_json(self, name, data):
+        fd, tmp_path = tempfile.mkstemp(dir=self.profile_dir, prefix=".tmp-")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=1)
+        os.replace(tmp_path, self._path(name))
+
+    def enabled_sessions(self):
+        """Sessions an operator switched profiling on for"""
+        try:
+            mtime = os.stat(self._path(self.ENABLED_FILE)).st_mtime
+        except OSError:
+            return set()
+        if mtime != self._enabled_mtime:
+            try:
+                with open(self._path(self.ENABLED_FILE), encoding="utf-8") as f:
+                    self._enabled = set(json.load(f))
+            except (OSError, ValueError):
+                self._enabled = set()
+            self._enabled_mtime = mtime
+        return self._enabled
+
+    def set_enabled(self, session_id, enabled=True):
+        """Admin toggle; picked up by every worker on its next rerun"""
+        sessions = set(self.enabled_sessions())
+        if enabled:
+            sessions.add(session_id)
+        else:
+            sessions.discard(session_id)
+        self._write_json(self.ENABLED_FILE, sorted(sessions))
+
+    def reason_for(self, session_id, requested=False):
+        """Why this rerun should be profiled, or None"""
+        if requested:
+            return "requested"
+        if session_id in self.enabled_sessions():
+            return "admin"
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return "sampled"
+        return None
+
+    @contextlib.contextmanager
+    def profile(self, session_id, reason):
+        """Profile the enclosed block and write a run record when it exits"""
+        with self._lock:
+            busy, self._active = self._active, True
+        if busy:
+            # Another rerun in this process is already being profiled
+            yield None
+            return
+
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        before = tracemalloc.take_snapshot()
+        profiler = cProfile.Profile()
+        started_at = time.time()
+        start = time.perf_counter()
+        outcome = "completed"
+        try:
+            profiler.enable()
+            yield profiler
+        except BaseException as e:
+            # st.rerun() and st.stop() end a run by raising
+            outcome = type(e).__name__
+            raise
+        finally:
+            profiler.disable()
+            duration = time.perf_counter() - start
+            after = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            if started_tracing:
+                tracemalloc.stop()
+            try:
+                self._record(session_id, reason, outcome, started_at, duration, profiler, before, after, peak)
+            finally:
+                with self._lock:
+                    self._active = False
+
+    def _record(self, session_id, reason, outcome, started_at, duration, profiler, before, after, peak):
+        run_id = f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(started_at))}-{uuid.uuid4().hex[:8]}"
+        profiler.dump_stats(self._path(f"{run_id}.prof"))
+
+        ignored = (
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        )
+        allocations = after.filter_traces(ignored).compare_to(before.filter_traces(ignored), "lineno")
+        allocators = [
+            {
+                "location": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                "size": stat.size_diff,
+                "count": stat.count_diff,
+            }
+            for stat in allocations[:self.top_n]
+            if stat.size_diff > 0
+        ]
+
+        stats = pstats.Stats(profiler).stats
+        functions = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:self.top_n]
+        record = {
+            "run_id": run_id,
+            "session_id": session_id,
+            "reason": reason,
+            "outcome": outcome,
+            "started_at": started_at,
+            "duration": round(duration, 6),
+            "peak_bytes": peak,
+            "functions": [
+                {
+                    "function": f"{name} ({os.path.basename(filename)}:{line})",
+                    "calls": calls,
+                    "own": round(own, 6),
+                    "cumulative": round(cumulative, 6),
+                }
+                for (filename, line, name), (_, calls, own, cumulative, _) in functions
+            ],
+            "allocators": allocators,
+        }
+        self._write_json(f"{run_id}.json", record)
+        self._rotate()
+        return record
+
+    def _rotate(self):
+        """Keep only the newest runs"""
+        runs = sorted(name[:-5] for name in os.listdir(self.profile_dir) if name.endswith(".json") and name != self.ENABLED_FILE)
+        for run_id in runs[:-self.keep]:
+            for ext in (".json", ".prof"):
+                with contextlib.suppress(OSError):
+                    os.remove(self._path(run_id + ext))
+
+    def load_run(self, run_id):
+        """A run record, or None"""
+        try:
+            with open(self._path(f"{os.path.basename(run_id)}.json"), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def slowest_runs(self, limit=20):
+        """Recorded runs, slowest first"""
+        runs = []
+        for name in os.listdir(self.profile_dir):
+            if name.endswith(".json") and name != self.ENABLED_FILE:
+                run = self.load_run(name[:-5])
+                if run is not None:
+                    runs.append(run)
+        runs.sort(key=lambda run: run["duration"], reverse=True)
+        return runs[:limit]
+
+def _print_run(run):
+    print(f"{run['run_id']}  session {run['session_id']}  {run['duration'] * 1000:.1f} ms  "
+          f"peak {run['peak_bytes'] / 1024:.0f} KiB  ({run['reason']}, {run['outcome']})")
+    print("\nTop functions by cumulative time:")
+    for entry in run["functions"]:
+        print(f"  {entry['cumulative'] * 1000:9.2f} ms {entry['calls']:7d}x  {entry['function']}")
+    print("\nTop allocators:")
+    for entry in run["allocators"]:
+        print(f"  {entry['size'] / 1024:9.1f} KiB {entry['count']:7d} blocks  {entry['location']}")
+    print(f"\nFull stats: python -m pstats {run['run_id']}.prof")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect and control rerun profiling")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("enable").add_argument("session_id")
+    commands.add_parser("disable").add_argument("session_id")
+    commands.add_parser("list").add_argument("--limit", type=int, default=20)
+    commands.add_parser("show").add_argument("run_id")
+    args = parser.parse_args()
+
+    profiler = RerunProfiler()
+    if args.command in ("enable", "disable"):
+        profiler.set_enabled(args.session_id, args.command == "enable")
+        print(f"Profiling {args.command}d for session {args.session_id}")
+    elif args.command == "list":
+        for run in profiler.slowest_runs(args.limit):
+            top = run["allocators"][0]["location"] if run["allocators"] else "-"
+            print(f"{run['run_id']}  {run['duration'] * 1000:9.1f} ms  {run['peak_bytes'] / 1024:8.0f} KiB  "
+                  f"{run['reason']:9}  {run['session_id'][:8]}  top allocator {top}")
+    else:
+        run = profiler.load_run(args.run_id)
+        if run is None:
+            parser.error(f"no such run: {args.run_id}")
+        _print_run(run)
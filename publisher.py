@@ -0,0 +1,254 @@
+import contextlib
+import gzip
+import hashlib
+import json
+import os
+import re
+import secrets
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+import settings
+from assets import AssetBundler
+from exporter import SiteExporter
+from factory import BaseModel
+
+try:
+    import brotli
+except ImportError:  # Brotli variants are optional
+    brotli = None
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows; fall back to the thread lock
+    fcntl = None
+
+class StaticPublisher(BaseModel):
+    """Writes published sites as precompressed static files with content-hashed names"""
+
+    MANIFEST_FILE = "manifest.json"
+    SITES_FILE = "sites.json"
+    RETIRED_FILE = "retired.json"
+    ASSET_DIR = "assets"
+    CONTENT_TYPES = {
+        ".html": "text/html; charset=utf-8",
+        ".css": "text/css; charset=utf-8",
+        ".js": "application/javascript; charset=utf-8",
+        ".json": "application/json",
+        ".svg": "image/svg+xml",
+        ".woff2": "font/woff2",
+        ".woff": "font/woff",
+        ".ttf": "font/ttf",
+        ".png": "image/png",
+        ".jpg": "image/jpeg",
+        ".webp": "image/webp",
+    }
+    COMPRESSIBLE = (".html", ".css", ".js", ".json", ".svg")
+    # Hashed files never change; the page itself must be revalidated
+    IMMUTABLE = "public, max-age=31536000, immutable"
+    REVALIDATE = "public, max-age=0, must-revalidate"
+
+    def __init__(self, publish_dir=None, base_url=None, retain_seconds=None):
+        self.publish_dir = publish_dir or settings.PUBLISH_DIR
+        self.retain_seconds = settings.PUBLISH_RETAIN_SECONDS if retain_seconds is None else retain_seconds
+        self.base_url = (base_url or settings.PUBLISH_BASE_URL).rstrip("/")
+        self.exporter = SiteExporter()
+        self.asset_bundler = AssetBundler(url_prefix=f"{self.ASSET_DIR}/")
+        self._lock = threading.Lock()
+        os.makedirs(self.publish_dir, exist_ok=True)
+
+    @staticmethod
+    def _hashed_name(default_name, content):
+        stem, ext = os.path.splitext(default_name)
+        digest = hashlib.sha256(content.encode("utf-8")).hexdigest()[:12]
+        return f"{stem}.{digest}{ext}"
+
+    @staticmethod
+    def new_site_id():
+        """Random public id for a new site, unrelated to any session id"""
+        return secrets.token_urlsafe(12)
+
+    @staticmethod
+    def _site_id(site_id):
+        return re.sub(r"[^a-zA-Z0-9_-]", "", site_id)[:64]
+
+    def _write(self, path, data):
+        """Atomically write a file and its precompressed variants"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        variants = {"": data}
+        if path.endswith(self.COMPRESSIBLE):
+            variants[".gz"] = gzip.compress(data, compresslevel=9, mtime=0)
+            if brotli is not None:
+                variants[".br"] = brotli.compress(data, quality=11)
+        for suffix, payload in variants.items():
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(payload)
+            os.replace(tmp_path, path + suffix)
+
+    def _load_json(self, name, default):
+        try:
+            with open(os.path.join(self.publish_dir, name), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return default
+
+    def _save_json(self, name, data):
+        self._write(os.path.join(self.publish_dir, name), json.dumps(data, indent=1, sort_keys=True).encode("utf-8"))
+
+    @contextlib.contextmanager
+    def _index_lock(self):
+        """Serialize index updates across threads and worker processes"""
+        with self._lock, open(os.path.join(self.publish_dir, ".lock"), "w") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+    def _headers(self, url_path, file_path, cache_control):
+        """Precomputed response metadata for one published file"""
+        ext = os.path.splitext(file_path)[1]
+        with open(file_path, "rb") as f:
+            etag = hashlib.sha256(f.read()).hexdigest()[:16]
+        entry = {
+            "file": os.path.relpath(file_path, self.publish_dir),
+            "type": self.CONTENT_TYPES.get(ext, "application/octet-stream"),
+            "cache_control": cache_control,
+            "etag": f'"{etag}"',
+            "size": os.path.getsize(file_path),
+            "encodings": {},
+        }
+        for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+            if os.path.exists(file_path + suffix):
+                entry["encodings"][encoding] = {
+                    "file": entry["file"] + suffix,
+                    "size": os.path.getsize(file_path + suffix),
+                }
+        return url_path, entry
+
+    def site_url(self, site_id):
+        """Public URL of a published site"""
+        return f"{self.base_url}/{self._site_id(site_id)}/"
+
+    def publish(self, site_id, html_content, title=None):
+        """Write a site to the publish directory and record it in the index"""
+        try:
+            site_id = self._site_id(site_id)
+            site_dir = os.path.join(self.publish_dir, site_id)
+
+            # Local, hashed copies of CDN assets, then hashed CSS/JS files
+            html_content, asset_report = self.asset_bundler.process(html_content, mode="hashed")
+            index_html, files = self.exporter.split_assets(html_content, self._hashed_name)
+
+            headers = {}
+            for name, content in files.items():
+                path = os.path.join(site_dir, name)
+                self._write(path, content.encode("utf-8"))
+                key, entry = self._headers(f"/{site_id}/{name}", path, self.IMMUTABLE)
+                headers[key] = entry
+            for file_name in asset_report["files"]:
+                path = os.path.join(site_dir, self.ASSET_DIR, file_name)
+                if not os.path.exists(path):
+                    with open(self.asset_bundler.cache.path(file_name), "rb") as f:
+                        self._write(path, f.read())
+                key, entry = self._headers(f"/{site_id}/{self.ASSET_DIR}/{file_name}", path, self.IMMUTABLE)
+                headers[key] = entry
+
+            # The page goes last so visitors never see it before its assets exist.
+            # Its body is content-addressed too: a server still holding the
+            # previous manifest keeps sending the previous, unchanged file.
+            index_path = os.path.join(site_dir, self._hashed_name("index.html", index_html))
+            self._write(index_path, index_html.encode("utf-8"))
+            key, entry = self._headers(f"/{site_id}/index.html", index_path, self.REVALIDATE)
+            headers[key] = entry
+            headers[f"/{site_id}/"] = entry
+            # Plain copy for servers that map URLs straight to files (nginx_config)
+            self._write(os.path.join(site_dir, "index.html"), index_html.encode("utf-8"))
+
+            site = {
+                "site_id": site_id,
+                "title": title or self._title(index_html) or site_id,
+                "url": self.site_url(site_id),
+                "published_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                "bytes": sum({entry["file"]: entry["size"] for entry in headers.values()}.values()),
+            }
+            live = {entry["file"] for entry in headers.values()}
+            with self._index_lock():
+                manifest = self._load_json(self.MANIFEST_FILE, {})
+                # Drop entries from the previous version of this site
+                previous = {path: entry for path, entry in manifest.items() if path.startswith(f"/{site_id}/")}
+                manifest = {path: entry for path, entry in manifest.items() if path not in previous}
+                manifest.update(headers)
+                self._save_json(self.MANIFEST_FILE, manifest)
+
+                sites = self._load_json(self.SITES_FILE, {})
+                sites[site_id] = site
+                self._save_json(self.SITES_FILE, sites)
+
+                self._prune(site_id, {entry["file"] for entry in previous.values()} - live, live)
+            return site, None
+        except Exception as e:
+            return None, f"Error publishing website: {str(e)}"
+
+    def _prune(self, site_id, retired_files, live_files):
+        """Remove files of earlier versions of a site once no server can still be sending them (lock held)
+
+        Servers pick up a new manifest a moment after it is written, so
+        files of the replaced version are only retired now and deleted on a
+        later publish, after retain_seconds.
+        """
+        now = time.time()
+        retired = self._load_json(self.RETIRED_FILE, {})
+        for file_name in retired_files:
+            retired.setdefault(file_name, now)
+        live = set()
+        for file_name in live_files:
+            live.update({file_name, file_name + ".gz", file_name + ".br"})
+        site_dir = os.path.join(self.publish_dir, site_id)
+        for root, _, names in os.walk(site_dir):
+            for name in names:
+                path = os.path.join(root, name)
+                relative = os.path.relpath(path, self.publish_dir)
+                base = re.sub(r"\.(gz|br)$", "", relative)
+                if relative in live or base == os.path.join(site_id, "index.html"):
+                    continue
+                # Files no manifest ever listed (an interrupted publish) age by mtime
+                since = retired.get(base, os.path.getmtime(path))
+                if now - since >= self.retain_seconds:
+                    os.remove(path)
+        retired = {
+            file_name: since for file_name, since in retired.items()
+            if os.path.exists(os.path.join(self.publish_dir, file_name)) and file_name not in live
+        }
+        self._save_json(self.RETIRED_FILE, retired)
+
+    @staticmethod
+    def _title(html_content):
+        match = re.search(r"<title[^>]*>(.*?)</title>", html_content, re.S | re.I)
+        return match.group(1).strip() if match else None
+
+    def get_site(self, site_id):
+        """Index entry of a published site, or None"""
+        return self._load_json(self.SITES_FILE, {}).get(self._site_id(site_id))
+
+    def list_sites(self):
+        """All published sites, newest first"""
+        sites = self._load_json(self.SITES_FILE, {}).values()
+        return sorted(sites, key=lambda site: site["published_at"], reverse=True)
+
+    def unpublish(self, site_id):
+        """Remove a site and its index entries"""
+        site_id = self._site_id(site_id)
+        with self._index_lock():
+            manifest = self._load_json(self.MANIFEST_FILE, {})
+            manifest = {path: entry for path, entry in manifest.items() if not path.startswith(f"/{site_id}/")}
+            self._save_json(self.MANIFEST_FILE, manifest)
+            sites = self._load_json(self.SITES_FILE, {})
+            sites.pop(site_id, None)
+            self._save_json(self.SITES_FILE, sites)
+            retired = self._load_json(self.RETIRED_FILE, {})
+            retired = {path: since for path, since in retired.items() if not path.startswith(f"{site_id}/")}
+            self._save_json(self.RETIRED_FILE, retired)
+        shutil.rmtree(os.path.join(self.publish_dir, site_id), ignore_errors=True)
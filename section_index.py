@@ -0,0 +1,315 @@
+import hashlib
+import re
+import threading
+from collections import Counter, OrderedDict
+from html.parser import HTMLParser
+
+import settings
+from assets import AssetBundler
+from factory import BaseModel
+from minify import minify_css
+
+class _SectionParser(HTMLParser):
+    """Records source spans of landmarks, elements with ids, headings and style blocks"""
+
+    LANDMARKS = {"header", "nav", "main", "section", "article", "aside", "footer", "form", "table", "ul", "ol"}
+    HEADINGS = {"h1", "h2", "h3", "h4", "h5", "h6"}
+    VOID_TAGS = {
+        "area", "base", "br", "col", "embed", "hr", "img", "input",
+        "link", "meta", "source", "track", "wbr",
+    }
+
+    def __init__(self, html_content):
+        super().__init__(convert_charrefs=False)
+        self.html_content = html_content
+        # HTMLParser counts lines by "\n" only, unlike str.splitlines()
+        self._line_offsets = [0] + [match.end() for match in re.finditer("\n", html_content)]
+        self.sections = []
+        self.styles = []
+        self._stack = []
+        self._style_start = None
+        self.feed(html_content)
+        self.close()
+
+    def _offset(self):
+        line, column = self.getpos()
+        return self._line_offsets[line - 1] + column
+
+    def handle_starttag(self, tag, attrs):
+        start = self._offset()
+        if tag == "style":
+            self._style_start = start + len(self.get_starttag_text())
+        if tag in self.VOID_TAGS:
+            return
+        attributes = dict(attrs)
+        section = None
+        if tag in self.LANDMARKS or tag in self.HEADINGS or attributes.get("id"):
+            section = {
+                "tag": tag,
+                "id": attributes.get("id") or "",
+                "classes": (attributes.get("class") or "").split(),
+                "aria": attributes.get("aria-label") or "",
+                "label": "",
+                "start": start,
+                "end": None,
+                "depth": len(self._stack),
+            }
+            self.sections.append(section)
+        self._stack.append((tag, section))
+
+    def handle_endtag(self, tag):
+        if tag == "style" and self._style_start is not None:
+            self.styles.append((self._style_start, self._offset()))
+            self._style_start = None
+        if not any(open_tag == tag for open_tag, _ in self._stack):
+            return
+        end = self.html_content.find(">", self._offset()) + 1
+        while self._stack:
+            open_tag, section = self._stack.pop()
+            if open_tag == tag:
+                if section is not None:
+                    section["end"] = end
+                    if tag in self.HEADINGS:
+                        # The first heading inside a landmark names it
+                        for _, parent in reversed(self._stack):
+                            if parent is not None and not parent["label"]:
+                                parent["label"] = section["label"]
+                                break
+                return
+            # Implicitly closed elements have no reliable span (end stays None)
+
+    def handle_data(self, data):
+        for open_tag, section in reversed(self._stack):
+            if section is not None and open_tag in self.HEADINGS:
+                section["label"] = " ".join((section["label"] + " " + data).split())[:80]
+                return
+
+class SectionIndex:
+    """Indexed section tree of one version of a page"""
+
+    def __init__(self, html_content):
+        parser = _SectionParser(html_content)
+        self.html_content = html_content
+        self.sections = [section for section in parser.sections if section["end"]]
+        self.styles = parser.styles
+
+    def css(self):
+        return "\n".join(self.html_content[start:end] for start, end in self.styles)
+
+class SectionIndexer(BaseModel):
+    """Resolves an edit request to one element of the page so only that element is regenerated"""
+
+    STOPWORDS = {
+        "a", "an", "the", "and", "or", "of", "to", "in", "on", "for", "with", "make", "change",
+        "update", "please", "can", "you", "it", "its", "this", "that", "my", "into", "be", "more",
+        "less", "add", "use", "set", "from", "at", "so", "is", "are", "some", "bit", "little",
+    }
+    TAG_WORDS = {
+        "header": {"header", "hero", "banner", "top"},
+        "nav": {"nav", "navigation", "menu", "navbar", "links"},
+        "main": {"main", "content"},
+        "footer": {"footer", "bottom", "copyright"},
+        "form": {"form", "contact", "signup", "newsletter", "input"},
+        "table": {"table", "row", "column", "cell"},
+        "ul": {"list"},
+        "ol": {"list"},
+        "aside": {"sidebar", "aside"},
+        "h1": {"heading", "headline", "title", "main"},
+        "h2": {"heading", "subheading", "title"},
+        "h3": {"heading", "subheading"},
+    }
+    # Requests about the whole page are never narrowed to one element
+    GLOBAL_REQUEST = re.compile(
+        r"\b(whole|entire|every|all sections|everywhere|overall|dark mode|light mode|theme|"
+        r"colou?r scheme|palette|fonts?|typography|responsive|mobile|layout of the page|"
+        r"redesign|rewrite|start over|(?:page|site|tab|browser|document) title|favicon|meta tags?)\b",
+        re.I
+    )
+    # New content goes between elements, so no single element can be regenerated for it
+    ADDITIVE_REQUEST = re.compile(
+        r"\b(add|insert|create|include|put|append)\b.*\b(sections?|after|before|below|above|between|underneath)\b|"
+        r"\b(new|another|extra) (section|block|part)\b",
+        re.I
+    )
+    WORD = re.compile(r"[a-z0-9]+")
+    STYLE_BLOCK = re.compile(r"(<style[^>]*>)(.*?)(</style>)", re.S | re.I)
+    CLASS_ATTR = re.compile(r"""\bclass\s*=\s*["']([^"']*)["']""", re.I)
+    ID_ATTR = re.compile(r"""\bid\s*=\s*["']([^"']*)["']""", re.I)
+    TAG_NAME = re.compile(r"<([a-zA-Z][\w-]*)")
+    SELECTOR_TOKEN = re.compile(r"([.#]?)(-?[_a-zA-Z][\w-]*)")
+    SELECTOR_ARGS = re.compile(r"\([^()]*\)|\[[^\]]*\]|::?[\w-]+")
+    KEYFRAMES = re.compile(r"@(?:-\w+-)?keyframes\s+([\w-]+)", re.I)
+    GROUPING_RULES = ("@media", "@supports", "@layer", "@container")
+    CODE_FENCE = re.compile(r"^```[\w-]*\s*|\s*```\s*$")
+
+    def __init__(self, max_chars=None, max_share=None, cache_entries=None):
+        self.max_chars = max_chars or settings.SECTION_EDIT_MAX_CHARS
+        self.max_share = max_share or settings.SECTION_EDIT_MAX_SHARE
+        self.cache_entries = cache_entries or settings.SECTION_INDEX_ENTRIES
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._metrics = {"targeted_edits": 0, "full_edits": 0, "fragment_chars": 0, "page_chars": 0}
+
+    def index(self, html_content):
+        """Section index for a page, parsed once per version"""
+        key = hashlib.sha256(html_content.encode("utf-8")).hexdigest()[:16]
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+        index = SectionIndex(html_content)
+        with self._lock:
+            self._cache[key] = index
+            while len(self._cache) > self.cache_entries:
+                self._cache.popitem(last=False)
+        return index
+
+    def _words(self, text):
+        words = set()
+        for word in self.WORD.findall(text.lower()):
+            if word in self.STOPWORDS:
+                continue
+            words.add(word)
+            if len(word) > 3 and word.endswith("s"):
+                words.add(word[:-1])
+        return words
+
+    def _score(self, section, prompt_words, unique_tag):
+        """(score, whether the prompt names this element rather than just its kind)"""
+        names = self._words(" ".join([section["id"]] + section["classes"]).replace("-", " ").replace("_", " "))
+        label = self._words(f"{section['label']} {section['aria']}")
+        tags = self.TAG_WORDS.get(section["tag"], {section["tag"]})
+        score = 0
+        identified = False
+        for word in prompt_words:
+            if word in names:
+                score += 3
+                identified = True
+            elif word in tags:
+                score += 2
+                # "the footer" names the page's only footer, "the section" names none of many
+                identified = identified or unique_tag
+            elif word in label:
+                score += 2
+                identified = True
+        return score, identified
+
+    def resolve(self, index, prompt):
+        """The section an edit request is about, or None if it is not about one part"""
+        if self.GLOBAL_REQUEST.search(prompt) or self.ADDITIVE_REQUEST.search(prompt):
+            return None
+        prompt_words = self._words(prompt)
+        tag_counts = Counter(section["tag"] for section in index.sections)
+        best = None
+        for section in index.sections:
+            score, identified = self._score(section, prompt_words, tag_counts[section["tag"]] == 1)
+            if score < 2 or not identified:
+                continue
+            size = section["end"] - section["start"]
+            # Higher score first; the smaller, more specific element on ties
+            if best is None or (score, -size) > (best[0], -best[1]):
+                best = (score, size, section)
+        return best[2] if best else None
+
+    def _fragment_tokens(self, fragment):
+        classes = {token for value in self.CLASS_ATTR.findall(fragment) for token in value.split()}
+        ids = set(self.ID_ATTR.findall(fragment))
+        tags = {tag.lower() for tag in self.TAG_NAME.findall(fragment)}
+        return classes, ids, tags
+
+    def _selector_applies(self, selector, classes, ids, tags):
+        tokens = self.SELECTOR_TOKEN.findall(self.SELECTOR_ARGS.sub(" ", selector))
+        named = [(kind, name) for kind, name in tokens if kind]
+        if named:
+            return any(name in (classes if kind == "." else ids) for kind, name in named)
+        # Plain element selectors only count for elements inside the fragment
+        element_tags = {name.lower() for _, name in tokens} - {"html", "body"}
+        return bool(element_tags) and element_tags <= tags
+
+    def _relevant_rules(self, css, tokens):
+        kept = []
+        for prelude, body in AssetBundler._split_rules(css):
+            selector = prelude.strip()
+            if body is None or not selector:
+                continue
+            if selector.lower().startswith(self.GROUPING_RULES):
+                inner = self._relevant_rules(body, tokens)
+                if inner:
+                    kept.append(f"{selector}{{{inner}}}")
+            elif not selector.startswith("@"):
+                if any(self._selector_applies(part, *tokens) for part in selector.split(",")):
+                    kept.append(f"{selector}{{{body}}}")
+        return "".join(kept)
+
+    def relevant_css(self, index, fragment):
+        """Rules from the page's style blocks that apply to anything inside the fragment"""
+        css = re.sub(r"/\*.*?\*/", "", index.css(), flags=re.S)
+        rules = self._relevant_rules(css, self._fragment_tokens(fragment))
+        # Keyframes the selected rules animate with
+        for prelude, body in AssetBundler._split_rules(css):
+            match = self.KEYFRAMES.match(prelude.strip())
+            if match and body is not None and re.search(rf"(?<![\w-]){re.escape(match.group(1))}(?![\w-])", rules):
+                rules += f"{prelude.strip()}{{{body}}}"
+        return minify_css(rules)
+
+    def plan_edit(self, html_content, prompt):
+        """A targeted edit for the prompt, or None when the whole page should be regenerated"""
+        plan = None
+        try:
+            index = self.index(html_content)
+            section = self.resolve(index, prompt)
+            if section is not None:
+                size = section["end"] - section["start"]
+                if size <= self.max_chars and size <= self.max_share * len(html_content):
+                    fragment = html_content[section["start"]:section["end"]]
+                    description = f"the <{section['tag']}" + (f' id="{section["id"]}"' if section["id"] else "") + "> element"
+                    if section["label"]:
+                        description += f' ("{section["label"]}")'
+                    plan = {
+                        "start": section["start"],
+                        "end": section["end"],
+                        "tag": section["tag"],
+                        "fragment": fragment,
+                        "css": self.relevant_css(index, fragment),
+                        "label": description,
+                    }
+        except Exception:
+            plan = None
+
+        with self._lock:
+            if plan is None:
+                self._metrics["full_edits"] += 1
+            else:
+                self._metrics["targeted_edits"] += 1
+                self._metrics["fragment_chars"] += len(plan["fragment"]) + len(plan["css"])
+                self._metrics["page_chars"] += len(html_content)
+        return plan
+
+    def apply_edit(self, html_content, plan, output):
+        """Splice the model's output for a planned edit back into the page; None if unusable"""
+        text = self.CODE_FENCE.sub("", output.strip()).strip()
+        if re.match(r"(<!doctype|<html)\b", text, re.I):
+            # The model sent the whole page back anyway
+            return text
+        css = "".join(match.group(2) for match in self.STYLE_BLOCK.finditer(text))
+        element = self.STYLE_BLOCK.sub("", text).strip()
+        if not (element.startswith("<") and element.endswith(">")):
+            return None
+
+        html_content = html_content[:plan["start"]] + element + html_content[plan["end"]:]
+        if css.strip():
+            head_end = html_content.lower().find("</head>")
+            last_style = html_content.lower().rfind("</style>", 0, head_end if head_end >= 0 else len(html_content))
+            if last_style >= 0:
+                # Later rules win, so changed rules go after the existing ones
+                html_content = html_content[:last_style] + css + html_content[last_style:]
+            elif head_end >= 0:
+                html_content = html_content[:head_end] + f"<style>{css}</style>" + html_content[head_end:]
+            else:
+                html_content = f"<style>{css}</style>" + html_content
+        return html_content
+
+    def get_metrics(self):
+        """How often edits were narrowed to one element, and how much smaller the requests were"""
+        with self._lock:
+            return dict(self._metrics, indexed_versions=len(self._cache))
@@ -0,0 +1,349 @@
+import functools
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import settings
+from factory import BaseModel
+from memory_budget import MemoryBudget
+from models import ChatSession, Message
+
+class SessionStore(BaseModel):
+    """Persists chat sessions in SQLite and keeps a bounded set of them in memory"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS sessions (
+            id TEXT PRIMARY KEY,
+            personality TEXT NOT NULL,
+            show_results INTEGER NOT NULL DEFAULT 0,
+            show_published INTEGER NOT NULL DEFAULT 0,
+            current_html_id TEXT,
+            site_id TEXT,
+            updated_at REAL NOT NULL,
+            version INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            timestamp TEXT,
+            personality TEXT,
+            html_id TEXT
+        );
+        CREATE INDEX IF NOT EXISTS messages_by_session ON messages (session_id, id);
+        CREATE TABLE IF NOT EXISTS html_bodies (
+            id TEXT PRIMARY KEY,
+            body TEXT NOT NULL
+        );
+    """
+    # Session attributes saved by save_state, with their column in the sessions table
+    STATE_FIELDS = (
+        ("current_personality", "personality"),
+        ("show_results", "show_results"),
+        ("show_published", "show_published"),
+        ("current_html_ref", "current_html_id"),
+        ("site_id", "site_id"),
+    )
+    SAVE_ATTEMPTS = 5
+
+    def __init__(self, db_path=None, max_resident_sessions=None, idle_seconds=None, budget=None):
+        self.db_path = db_path or settings.SESSION_DB
+        self.max_resident_sessions = max_resident_sessions or settings.MAX_RESIDENT_SESSIONS
+        self.idle_seconds = idle_seconds or settings.SESSION_IDLE_SECONDS
+        self.budget = budget or MemoryBudget()
+        self._lock = threading.RLock()
+        self._resident = OrderedDict()
+        self._html_cache = OrderedDict()
+        self._conn = self._connect()
+
+    def _connect(self):
+        """Open the database in WAL mode so several workers can share it"""
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(self.SCHEMA)
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(sessions)")}
+        if "site_id" not in columns:
+            # Databases created before published sites had their own id
+            conn.execute("ALTER TABLE sessions ADD COLUMN site_id TEXT")
+        if "version" not in columns:
+            # Databases created before sessions could be shared between workers
+            conn.execute("ALTER TABLE sessions ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+        return conn
+
+    @staticmethod
+    def html_id(html_content):
+        """Content hash used as the key for stored HTML bodies"""
+        return hashlib.sha256(html_content.encode("utf-8")).hexdigest()
+
+    def _store_html(self, html_content):
+        html_id = self.html_id(html_content)
+        self._conn.execute(
+            "INSERT OR IGNORE INTO html_bodies (id, body) VALUES (?, ?)",
+            (html_id, html_content)
+        )
+        return html_id
+
+    def create_session(self):
+        """Create a new empty session and return its id"""
+        session_id = uuid.uuid4().hex
+        session = ChatSession(self, session_id)
+        with self._lock:
+            self.save_state(session)
+            self._make_resident(session)
+        return session_id
+
+    def session_exists(self, session_id):
+        """Check whether a session id is known to the store"""
+        with self._lock:
+            if session_id in self._resident:
+                return True
+            row = self._conn.execute("SELECT 1 FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        return row is not None
+
+    def load_session(self, session_id):
+        """Return the session, reading it from disk if it is not resident or another worker changed it"""
+        with self._lock:
+            self.evict_idle()
+            if session_id in self._resident:
+                session, _ = self._resident.pop(session_id)
+                row = self._conn.execute("SELECT version FROM sessions WHERE id = ?", (session_id,)).fetchone()
+                if row is None or row[0] == session.version:
+                    self._resident[session_id] = (session, time.monotonic())
+                    return session
+                self.budget.forget(f"history:{session_id}", evicted=False)
+            session = self._read_session(session_id)
+            self._make_resident(session)
+            return session
+
+    def _read_session(self, session_id):
+        session = ChatSession(self, session_id)
+        row = self._read_state(session_id)
+        if row is None:
+            self.save_state(session)
+            return session
+
+        self._apply_state(session, row, [field for field, _ in self.STATE_FIELDS])
+        session.messages = self._read_messages(session_id)
+        return session
+
+    def _read_state(self, session_id):
+        row = self._conn.execute(
+            "SELECT version, " + ", ".join(column for _, column in self.STATE_FIELDS) + " FROM sessions WHERE id = ?",
+            (session_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        state = dict(zip((field for field, _ in self.STATE_FIELDS), row[1:]))
+        state["show_results"] = bool(state["show_results"])
+        state["show_published"] = bool(state["show_published"])
+        return row[0], state
+
+    def _apply_state(self, session, row, fields):
+        """Take the given fields from a stored row and remember the row as the last one seen"""
+        version, state = row
+        for field in fields:
+            if field == "current_html_ref":
+                if state[field]:
+                    session.attach_current_html(state[field], self._loader_for(session.session_id))
+                else:
+                    session.current_html = None
+            else:
+                setattr(session, field, state[field])
+        session.version = version
+        session.stored_state = state
+
+    def _read_messages(self, session_id):
+        messages = []
+        rows = self._conn.execute(
+            "SELECT role, content, timestamp, personality, html_id FROM messages WHERE session_id = ? ORDER BY id",
+            (session_id,)
+        )
+        for role, content, timestamp, personality, html_id in rows:
+            message = Message(role, content, personality, timestamp=timestamp)
+            if html_id:
+                message.attach_html(html_id, self._loader_for(session_id))
+            messages.append(message)
+        return messages
+
+    def _bump_version(self, session_id):
+        """Mark a session as changed so other workers reload it (transaction held)"""
+        resident = self._resident.get(session_id)
+        if resident:
+            session = resident[0]
+            updated = self._conn.execute(
+                "UPDATE sessions SET version = version + 1, updated_at = ? WHERE id = ? AND version = ?",
+                (time.time(), session_id, session.version)
+            ).rowcount
+            if updated:
+                # Nobody else wrote in between, so the resident copy is still current
+                session.version += 1
+                return
+        # Otherwise the resident copy is stale and is reloaded on its next load
+        self._conn.execute(
+            "UPDATE sessions SET version = version + 1, updated_at = ? WHERE id = ?",
+            (time.time(), session_id)
+        )
+
+    def _loader_for(self, session_id):
+        """HTML loader that charges what it loads to the given session"""
+        return functools.partial(self.load_html, session_id=session_id)
+
+    def _track_history(self, session):
+        """Account for the message text a resident session holds"""
+        key = f"history:{session.session_id}"
+        nbytes = sum(self.budget.measure(message.content) for message in session.messages)
+        self.budget.forget(key, evicted=False)
+        self.budget.track(key, nbytes, session.session_id)
+
+    def _make_resident(self, session):
+        self._resident[session.session_id] = (session, time.monotonic())
+        self._track_history(session)
+        while len(self._resident) > self.max_resident_sessions:
+            self._drop_resident(next(iter(self._resident)))
+
+    def _drop_resident(self, session_id):
+        self._resident.pop(session_id, None)
+        self.budget.forget(f"history:{session_id}")
+
+    def _drop_html(self, html_id):
+        self._html_cache.pop(html_id, None)
+        self.budget.forget(f"html:{html_id}")
+
+    def _enforce_budget(self, session_id=None):
+        """Evict cached HTML bodies and idle sessions until both budgets are met"""
+        pinned = set()
+        if session_id is not None:
+            pinned.add(f"history:{session_id}")
+            resident = self._resident.get(session_id)
+            if resident and resident[0].current_html_ref:
+                # The latest version is what gets rendered; older ones can be reloaded
+                pinned.add(f"html:{resident[0].current_html_ref}")
+            for key in self.budget.session_overflow(session_id, pinned):
+                if key.startswith("html:"):
+                    self._drop_html(key[len("html:"):])
+
+        for key in self.budget.process_overflow(pinned):
+            kind, _, ident = key.partition(":")
+            if kind == "html":
+                self._drop_html(ident)
+            elif kind == "history":
+                self._drop_resident(ident)
+
+    def evict_idle(self):
+        """Drop sessions that have not been touched recently from memory"""
+        cutoff = time.monotonic() - self.idle_seconds
+        with self._lock:
+            # The dict is kept in access order, so idle sessions sit at the front
+            while self._resident:
+                session_id, (_, last_access) = next(iter(self._resident.items()))
+                if last_access >= cutoff:
+                    break
+                self._drop_resident(session_id)
+
+    def append_message(self, session_id, message):
+        """Write a single message, storing its HTML body separately"""
+        with self._lock, self._conn:
+            html_content = message.html_content
+            html_id = self._store_html(html_content) if html_content else None
+            self._conn.execute(
+                "INSERT INTO messages (session_id, role, content, timestamp, personality, html_id) VALUES (?, ?, ?, ?, ?, ?)",
+                (session_id, message.role, message.content, message.timestamp, message.personality, html_id)
+            )
+            self._bump_version(session_id)
+        with self._lock:
+            if html_id:
+                # Keep only a reference on the message; the body lives on disk
+                message.attach_html(html_id, self._loader_for(session_id))
+                self.budget.record_spill(self.budget.measure(html_content))
+            resident = self._resident.get(session_id)
+            if resident:
+                self._track_history(resident[0])
+                self._enforce_budget(session_id)
+
+    def clear_messages(self, session_id):
+        """Delete all messages of a session"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            self._bump_version(session_id)
+
+    def save_state(self, session):
+        """Write the session's flags and current HTML reference
+
+        The write only applies on top of the row version the session was read
+        at. If another worker saved in between, its changes are kept for every
+        field this worker did not change, and its messages are read back in.
+        """
+        with self._lock:
+            for _ in range(self.SAVE_ATTEMPTS):
+                with self._conn:
+                    row = self._read_state(session.session_id)
+                    if row is not None and row[0] != session.version:
+                        unchanged = [
+                            field for field, _ in self.STATE_FIELDS
+                            if getattr(session, field) == session.stored_state.get(field)
+                            and not (field == "current_html_ref" and session.current_html_ref is None and session.current_html)
+                        ]
+                        self._apply_state(session, row, unchanged)
+                        session.messages = self._read_messages(session.session_id)
+                    html_id = session.current_html_ref
+                    if html_id is None and session.current_html:
+                        html_id = self._store_html(session.current_html)
+                    version = row[0] + 1 if row is not None else 1
+                    saved = self._conn.execute(
+                        """INSERT INTO sessions (id, personality, show_results, show_published, current_html_id, site_id, updated_at, version)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                        ON CONFLICT(id) DO UPDATE SET
+                            personality = excluded.personality,
+                            show_results = excluded.show_results,
+                            show_published = excluded.show_published,
+                            current_html_id = excluded.current_html_id,
+                            site_id = excluded.site_id,
+                            updated_at = excluded.updated_at,
+                            version = excluded.version
+                        WHERE sessions.version = ?""",
+                        (session.session_id, session.current_personality, int(session.show_results),
+                         int(session.show_published), html_id, session.site_id, time.time(), version, version - 1)
+                    ).rowcount
+                if saved:
+                    break
+            else:
+                raise sqlite3.OperationalError(f"Session {session.session_id} kept changing while being saved")
+            if html_id and session.current_html_ref is None:
+                self.budget.record_spill(self.budget.measure(session.current_html))
+                session.attach_current_html(html_id, self._loader_for(session.session_id))
+            session.version = version
+            session.stored_state = {field: getattr(session, field) for field, _ in self.STATE_FIELDS}
+            resident = self._resident.get(session.session_id)
+            if resident and resident[0] is session:
+                self._track_history(session)
+
+    def load_html(self, html_id, session_id=None):
+        """Load an HTML body by id, caching it within the memory budget"""
+        with self._lock:
+            body = self._html_cache.get(html_id)
+            if body is None:
+                row = self._conn.execute("SELECT body FROM html_bodies WHERE id = ?", (html_id,)).fetchone()
+                if row is None:
+                    return None
+                body = row[0]
+                self._html_cache[html_id] = body
+            self.budget.track(f"html:{html_id}", self.budget.measure(body), session_id)
+            self._enforce_budget(session_id)
+            return body
+
+    def get_memory_metrics(self):
+        """Memory pressure metrics for this process"""
+        with self._lock:
+            metrics = self.budget.metrics()
+            metrics["resident_sessions"] = len(self._resident)
+            metrics["cached_html_bodies"] = len(self._html_cache)
+            return metrics
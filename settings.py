@@ -0,0 +1,84 @@
+"""Runtime settings, read once from environment variables"""
+import os
+
+# Root directory for everything the app writes to disk
+DATA_DIR = os.environ.get("WEB_GEN_DATA_DIR", os.path.join(os.getcwd(), ".web_gen"))
+
+# LLM backend: "groq", or "stub" for a local fake with configurable latency (see stub_llm.py)
+LLM_BACKEND = os.environ.get("WEB_GEN_LLM_BACKEND", "groq")
+STUB_LLM_LATENCY = float(os.environ.get("WEB_GEN_STUB_LLM_LATENCY", "1.0"))
+STUB_LLM_CHUNK_SECONDS = float(os.environ.get("WEB_GEN_STUB_LLM_CHUNK_SECONDS", "0.02"))
+STUB_LLM_SECTIONS = int(os.environ.get("WEB_GEN_STUB_LLM_SECTIONS", "6"))
+
+# Open every generated page in a browser on the machine running the app
+OPEN_IN_BROWSER = os.environ.get("WEB_GEN_OPEN_IN_BROWSER", "1") == "1"
+
+# Operator token: ?admin=<token> unlocks ?debug= diagnostics and ?profile=1
+# for that browser session. Unset means nobody gets them from the browser.
+ADMIN_TOKEN = os.environ.get("WEB_GEN_ADMIN_TOKEN", "")
+
+# Persistent chat sessions
+SESSION_DB = os.environ.get("WEB_GEN_SESSION_DB", os.path.join(DATA_DIR, "sessions.db"))
+MAX_RESIDENT_SESSIONS = int(os.environ.get("WEB_GEN_MAX_RESIDENT_SESSIONS", "200"))
+SESSION_IDLE_SECONDS = int(os.environ.get("WEB_GEN_SESSION_IDLE_SECONDS", "900"))
+
+# Memory budgets for resident payloads (HTML bodies and message history)
+SESSION_MEMORY_BUDGET = int(os.environ.get("WEB_GEN_SESSION_MEMORY_BUDGET", str(2 * 1024 * 1024)))
+PROCESS_MEMORY_BUDGET = int(os.environ.get("WEB_GEN_PROCESS_MEMORY_BUDGET", str(128 * 1024 * 1024)))
+
+# Cross-process response cache and upstream rate limiting
+SHARED_DB = os.environ.get("WEB_GEN_SHARED_DB", os.path.join(DATA_DIR, "shared.db"))
+RESPONSE_CACHE_TTL = int(os.environ.get("WEB_GEN_RESPONSE_CACHE_TTL", "3600"))
+INFLIGHT_TIMEOUT = int(os.environ.get("WEB_GEN_INFLIGHT_TIMEOUT", "120"))
+TOKENS_PER_MINUTE = int(os.environ.get("WEB_GEN_TOKENS_PER_MINUTE", "30000"))
+RATE_LIMIT_WAIT = int(os.environ.get("WEB_GEN_RATE_LIMIT_WAIT", "30"))
+
+# Generated-HTML optimizer (per personality, see HTMLGenerator.PERSONALITIES)
+OPTIMIZER_CACHE_ENTRIES = int(os.environ.get("WEB_GEN_OPTIMIZER_CACHE_ENTRIES", "32"))
+
+# Targeted edits: follow-ups about one part of the page regenerate only that element
+SECTION_EDIT_MAX_CHARS = int(os.environ.get("WEB_GEN_SECTION_EDIT_MAX_CHARS", "8000"))
+SECTION_EDIT_MAX_SHARE = float(os.environ.get("WEB_GEN_SECTION_EDIT_MAX_SHARE", "0.6"))
+SECTION_INDEX_ENTRIES = int(os.environ.get("WEB_GEN_SECTION_INDEX_ENTRIES", "32"))
+
+# Site bundle export
+EXPORT_CACHE_ENTRIES = int(os.environ.get("WEB_GEN_EXPORT_CACHE_ENTRIES", "8"))
+
+# Offline asset cache for fonts, icons and third-party stylesheets
+ASSET_CACHE_DIR = os.environ.get("WEB_GEN_ASSET_CACHE_DIR", os.path.join(DATA_DIR, "assets"))
+ASSET_FIXTURES_DIR = os.environ.get("WEB_GEN_ASSET_FIXTURES_DIR", "")
+ASSET_FETCH = os.environ.get("WEB_GEN_ASSET_FETCH", "0") == "1"
+ASSET_URL_PREFIX = os.environ.get("WEB_GEN_ASSET_URL_PREFIX", "/assets/")
+ASSET_PREVIEW_ENTRIES = int(os.environ.get("WEB_GEN_ASSET_PREVIEW_ENTRIES", "16"))
+
+# Static publishing
+PUBLISH_DIR = os.environ.get("WEB_GEN_PUBLISH_DIR", os.path.join(DATA_DIR, "published"))
+PUBLISH_BASE_URL = os.environ.get("WEB_GEN_PUBLISH_BASE_URL", "http://localhost:8600")
+STATIC_HOST = os.environ.get("WEB_GEN_STATIC_HOST", "0.0.0.0")
+STATIC_PORT = int(os.environ.get("WEB_GEN_STATIC_PORT", "8600"))
+# Files of a replaced version stay on disk this long for servers still on the old manifest
+PUBLISH_RETAIN_SECONDS = float(os.environ.get("WEB_GEN_PUBLISH_RETAIN_SECONDS", "60"))
+
+# Background generation jobs
+JOB_WORKERS = int(os.environ.get("WEB_GEN_JOB_WORKERS", "8"))
+JOB_ABANDON_SECONDS = float(os.environ.get("WEB_GEN_JOB_ABANDON_SECONDS", "15"))
+JOB_RETAIN_SECONDS = float(os.environ.get("WEB_GEN_JOB_RETAIN_SECONDS", "300"))
+JOB_POLL_SECONDS = float(os.environ.get("WEB_GEN_JOB_POLL_SECONDS", "1"))
+
+# Speculative pre-generation of common follow-ups (opt-in), see speculation.py
+SPECULATION_ENABLED = os.environ.get("WEB_GEN_SPECULATION", "0") == "1"
+SPECULATION_PER_SESSION = int(os.environ.get("WEB_GEN_SPECULATION_PER_SESSION", "2"))
+SPECULATION_SESSIONS = int(os.environ.get("WEB_GEN_SPECULATION_SESSIONS", "32"))
+SPECULATION_MIN_SLACK = float(os.environ.get("WEB_GEN_SPECULATION_MIN_SLACK", "0.5"))
+SPECULATION_MAX_PROMPT_WORDS = int(os.environ.get("WEB_GEN_SPECULATION_MAX_PROMPT_WORDS", "8"))
+
+# Rerun profiling (cProfile + tracemalloc), see profiling.py
+PROFILE_DIR = os.environ.get("WEB_GEN_PROFILE_DIR", os.path.join(DATA_DIR, "profiles"))
+PROFILE_SAMPLE_RATE = float(os.environ.get("WEB_GEN_PROFILE_SAMPLE_RATE", "0"))
+PROFILE_KEEP = int(os.environ.get("WEB_GEN_PROFILE_KEEP", "100"))
+PROFILE_TOP_N = int(os.environ.get("WEB_GEN_PROFILE_TOP_N", "15"))
+
+# App stylesheets, written as hashed files to Streamlit's static folder when
+# server.enableStaticServing is on and inlined once per rerun otherwise
+STATIC_DIR = os.environ.get("WEB_GEN_STATIC_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "static"))
+STATIC_URL_PREFIX = os.environ.get("WEB_GEN_STATIC_URL_PREFIX", "app/static/")
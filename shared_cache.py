@@ -0,0 +1,206 @@
+import hashlib
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+
+import settings
+from factory import BaseModel
+
+class SharedState(BaseModel):
+    """SQLite file shared by every worker process on the host"""
+
+    SCHEMA = ""
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or settings.SHARED_DB
+        self._lock = threading.Lock()
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Autocommit mode so BEGIN IMMEDIATE can serve as a cross-process lock
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(self.SCHEMA)
+
+    def _transaction(self, work):
+        """Run work(conn) while holding the database write lock"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = work(self._conn)
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return result
+
+class SharedResponseCache(SharedState):
+    """Response cache with in-flight deduplication across worker processes"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS responses (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS inflight (
+            key TEXT PRIMARY KEY,
+            owner TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        );
+    """
+
+    def __init__(self, db_path=None, ttl=None, inflight_timeout=None):
+        super().__init__(db_path)
+        self.ttl = ttl or settings.RESPONSE_CACHE_TTL
+        self.inflight_timeout = inflight_timeout or settings.INFLIGHT_TIMEOUT
+        # Pids are reused and shared by every generator in a process
+        self.owner = f"{os.getpid()}:{secrets.token_hex(8)}"
+
+    @staticmethod
+    def make_key(**request):
+        """Stable hash of everything that determines an upstream response"""
+        payload = json.dumps(request, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """Return a cached response, or None if missing or expired"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM responses WHERE key = ? AND expires_at > ?",
+                (key, time.time())
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(self, key, value):
+        """Store a response and clear any in-flight claim on it"""
+        def work(conn):
+            now = time.time()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, now + self.ttl)
+            )
+            conn.execute("DELETE FROM inflight WHERE key = ?", (key,))
+            conn.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+        self._transaction(work)
+
+    def claim(self, key):
+        """Try to become the one worker computing this key"""
+        def work(conn):
+            now = time.time()
+            row = conn.execute("SELECT owner, expires_at FROM inflight WHERE key = ?", (key,)).fetchone()
+            if row and row[1] > now:
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO inflight (key, owner, expires_at) VALUES (?, ?, ?)",
+                (key, self.owner, now + self.inflight_timeout)
+            )
+            return True
+        return self._transaction(work)
+
+    def release(self, key):
+        """Give up this worker's claim without storing a result, e.g. after an error"""
+        # The claim may have expired and been taken over by another worker
+        self._transaction(lambda conn: conn.execute(
+            "DELETE FROM inflight WHERE key = ? AND owner = ?", (key, self.owner)
+        ))
+
+    def wait_for(self, key, poll_interval=0.25, cancel_event=None):
+        """Wait for another worker's in-flight result; None if it never arrives"""
+        deadline = time.time() + self.inflight_timeout
+        while time.time() < deadline:
+            if cancel_event is not None and cancel_event.is_set():
+                return None
+            value = self.get(key)
+            if value is not None:
+                return value
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT 1 FROM inflight WHERE key = ? AND expires_at > ?",
+                    (key, time.time())
+                ).fetchone()
+            if row is None:
+                # The owner finished without a result or gave up
+                return self.get(key)
+            time.sleep(poll_interval)
+        return None
+
+class SharedRateLimiter(SharedState):
+    """Token bucket for upstream LLM tokens shared by every worker on the host"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS buckets (
+            name TEXT PRIMARY KEY,
+            tokens REAL NOT NULL,
+            updated_at REAL NOT NULL
+        );
+    """
+
+    def __init__(self, db_path=None, tokens_per_minute=None, name="llm_tokens"):
+        super().__init__(db_path)
+        self.capacity = tokens_per_minute or settings.TOKENS_PER_MINUTE
+        self.refill_per_second = self.capacity / 60.0
+        self.name = name
+
+    def _refill(self, conn):
+        now = time.time()
+        row = conn.execute("SELECT tokens, updated_at FROM buckets WHERE name = ?", (self.name,)).fetchone()
+        if row is None:
+            tokens = float(self.capacity)
+        else:
+            tokens = min(self.capacity, row[0] + (now - row[1]) * self.refill_per_second)
+        return tokens, now
+
+    def _save(self, conn, tokens, now):
+        conn.execute(
+            "INSERT OR REPLACE INTO buckets (name, tokens, updated_at) VALUES (?, ?, ?)",
+            (self.name, tokens, now)
+        )
+
+    def try_acquire(self, cost):
+        """Take cost tokens if available; otherwise return seconds until they will be"""
+        cost = min(cost, self.capacity)
+
+        def work(conn):
+            tokens, now = self._refill(conn)
+            if tokens >= cost:
+                self._save(conn, tokens - cost, now)
+                return 0.0
+            self._save(conn, tokens, now)
+            return (cost - tokens) / self.refill_per_second
+        return self._transaction(work)
+
+    def acquire(self, cost, timeout=None, cancel_event=None):
+        """Block until cost tokens are available; False if that takes longer than timeout"""
+        timeout = settings.RATE_LIMIT_WAIT if timeout is None else timeout
+        deadline = time.time() + timeout
+        while True:
+            if cancel_event is not None and cancel_event.is_set():
+                return False
+            wait = self.try_acquire(cost)
+            if wait == 0.0:
+                return True
+            if time.time() + wait > deadline:
+                return False
+            time.sleep(min(wait, 1.0))
+
+    def refund(self, tokens):
+        """Return unused tokens once the real usage is known"""
+        if tokens <= 0:
+            return
+
+        def work(conn):
+            current, now = self._refill(conn)
+            self._save(conn, min(self.capacity, current + tokens), now)
+        self._transaction(work)
+
+    def available(self):
+        """Tokens currently available to all workers"""
+        def work(conn):
+            tokens, _ = self._refill(conn)
+            return tokens
+        return self._transaction(work)
@@ -0,0 +1,144 @@
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import settings
+from exporter import SiteExporter
+from factory import BaseModel
+from shared_cache import SharedRateLimiter
+
+class SpeculativeEditor(BaseModel):
+    """Pre-generates likely follow-up edits of a fresh page while the upstream budget has slack"""
+
+    # Most common first: (name, prompt sent to the model, follow-ups it answers)
+    FOLLOW_UPS = [
+        ("dark_mode", "Add a dark mode to the website",
+         re.compile(r"\b(dark|night)[ -]?(mode|theme)\b", re.I)),
+        ("mobile", "Make the website look great on mobile phones",
+         re.compile(r"\b(mobile|responsive|phones?|small screens?)\b", re.I)),
+        ("color_scheme", "Change the color scheme to a fresh, modern palette",
+         re.compile(r"\b(colou?r (scheme|palette)|palette|new colou?rs)\b", re.I)),
+        ("contact_form", "Add a contact form with name, email and message fields",
+         re.compile(r"\bcontact (form|section)\b", re.I)),
+    ]
+    # "Remove the dark mode" is not answered by the page with one added
+    NEGATION = re.compile(r"\b(remove|undo|revert|delete|without|disable|turn off|get rid|no)\b", re.I)
+
+    def __init__(self, enabled=None, per_session=None, max_sessions=None, min_slack=None, max_prompt_words=None):
+        self.enabled = settings.SPECULATION_ENABLED if enabled is None else enabled
+        self.per_session = per_session or settings.SPECULATION_PER_SESSION
+        self.max_sessions = max_sessions or settings.SPECULATION_SESSIONS
+        self.min_slack = settings.SPECULATION_MIN_SLACK if min_slack is None else min_slack
+        self.max_prompt_words = max_prompt_words or settings.SPECULATION_MAX_PROMPT_WORDS
+        self.rate_limiter = SharedRateLimiter()
+        # One worker: speculation never competes with real jobs for threads
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="speculation")
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()
+        self._metrics = {
+            "started": 0, "completed": 0, "failed": 0, "skipped_no_slack": 0,
+            "hits": 0, "misses": 0, "evicted_unused": 0, "cancelled": 0,
+        }
+
+    def match(self, prompt):
+        """Name of the speculated follow-up a request asks for, or None"""
+        if len(prompt.split()) > self.max_prompt_words or self.NEGATION.search(prompt):
+            # A longer request asks for more than the speculated edit
+            return None
+        names = [name for name, _, pattern in self.FOLLOW_UPS if pattern.search(prompt)]
+        return names[0] if len(names) == 1 else None
+
+    def speculate(self, session_id, base_html, make_task):
+        """Queue the top follow-ups of base_html; make_task(prompt) -> task(cancel_event, on_chunk)"""
+        if not self.enabled or not base_html:
+            return 0
+        entry = {"base": SiteExporter.content_hash(base_html), "results": {}, "pending": {}}
+        follow_ups = self.FOLLOW_UPS[:self.per_session]
+        with self._lock:
+            self._discard(session_id)
+            self._sessions[session_id] = entry
+            while len(self._sessions) > self.max_sessions:
+                self._discard(next(iter(self._sessions)))
+            for name, prompt, _ in follow_ups:
+                entry["pending"][name] = threading.Event()
+        for name, prompt, _ in follow_ups:
+            self._pool.submit(self._run, session_id, entry, name, make_task(prompt))
+        return len(follow_ups)
+
+    def _run(self, session_id, entry, name, task):
+        # speculate() and _discard() change pending from other threads
+        with self._lock:
+            cancel_event = entry["pending"].get(name)
+        if cancel_event is None or cancel_event.is_set():
+            return
+        # Only spend tokens real requests are not going to need
+        if self.rate_limiter.available() < self.min_slack * self.rate_limiter.capacity:
+            with self._lock:
+                entry["pending"].pop(name, None)
+                self._metrics["skipped_no_slack"] += 1
+            return
+
+        with self._lock:
+            self._metrics["started"] += 1
+        try:
+            html_content, _ = task(cancel_event, None)
+        except Exception:
+            html_content = None
+        with self._lock:
+            entry["pending"].pop(name, None)
+            if cancel_event.is_set():
+                return
+            if html_content and self._sessions.get(session_id) is entry:
+                entry["results"][name] = html_content
+                self._metrics["completed"] += 1
+            else:
+                self._metrics["failed"] += 1
+
+    def _discard(self, session_id):
+        """Drop a session's speculations, counting the ones nobody used (lock held)"""
+        entry = self._sessions.pop(session_id, None)
+        if entry is None:
+            return
+        for cancel_event in entry["pending"].values():
+            cancel_event.set()
+        self._metrics["cancelled"] += len(entry["pending"])
+        self._metrics["evicted_unused"] += len(entry["results"])
+
+    def take(self, session_id, base_html, prompt):
+        """Pre-generated HTML answering prompt for base_html, or None
+
+        Either way the page is about to change, so the session's other
+        speculations are evicted.
+        """
+        if not self.enabled:
+            return None
+        name = self.match(prompt)
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            html_content = None
+            if name and base_html and entry["base"] == SiteExporter.content_hash(base_html):
+                html_content = entry["results"].pop(name, None)
+            if html_content is not None:
+                self._metrics["hits"] += 1
+            else:
+                self._metrics["misses"] += 1
+            self._discard(session_id)
+            return html_content
+
+    def get_metrics(self):
+        """Hit rate and waste since startup, for tuning which follow-ups to speculate on"""
+        with self._lock:
+            served = self._metrics["hits"] + self._metrics["misses"]
+            produced = self._metrics["hits"] + self._metrics["evicted_unused"]
+            return dict(
+                self._metrics,
+                enabled=self.enabled,
+                sessions=len(self._sessions),
+                ready=sum(len(entry["results"]) for entry in self._sessions.values()),
+                pending=sum(len(entry["pending"]) for entry in self._sessions.values()),
+                hit_rate=self._metrics["hits"] / served if served else None,
+                used_share=self._metrics["hits"] / produced if produced else None,
+            )
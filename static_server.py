@@ -0,0 +1,211 @@
+"""
+Static file server for published sites
+
+Serves the files written by StaticPublisher straight from disk. Every
+response's headers are precomputed from the publish manifest, precompressed
+variants are picked by Accept-Encoding, and bodies are sent with sendfile
+so the payload never passes through Python.
+
+    python static_server.py [--host HOST] [--port PORT]
+
+The same directory can be served by nginx instead; see nginx_config().
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import settings
+
+class PublishedSites:
+    """In-memory copy of the publish manifest, reloaded when it changes"""
+
+    RELOAD_INTERVAL = 1.0
+
+    def __init__(self, publish_dir=None):
+        self.publish_dir = publish_dir or settings.PUBLISH_DIR
+        self.manifest_path = os.path.join(self.publish_dir, "manifest.json")
+        self._lock = threading.Lock()
+        self._routes = {}
+        self._mtime = None
+        self._checked_at = 0.0
+        self._reload()
+
+    def _reload(self):
+        try:
+            mtime = os.stat(self.manifest_path).st_mtime
+        except OSError:
+            return
+        if mtime == self._mtime:
+            return
+        with open(self.manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        self._routes = {path: self._compile(entry) for path, entry in manifest.items()}
+        self._mtime = mtime
+
+    def _compile(self, entry):
+        """Turn a manifest entry into ready-to-send header blocks per encoding"""
+        def header_block(size, encoding=None):
+            lines = [
+                "HTTP/1.1 200 OK",
+                f"Content-Type: {entry['type']}",
+                f"Content-Length: {size}",
+                f"Cache-Control: {entry['cache_control']}",
+                f"ETag: {entry['etag']}",
+                "Vary: Accept-Encoding",
+            ]
+            if encoding:
+                lines.append(f"Content-Encoding: {encoding}")
+            return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+        variants = {
+            encoding: (os.path.join(self.publish_dir, variant["file"]), header_block(variant["size"], encoding), variant["size"])
+            for encoding, variant in entry["encodings"].items()
+        }
+        variants[None] = (os.path.join(self.publish_dir, entry["file"]), header_block(entry["size"]), entry["size"])
+        return {"etag": entry["etag"], "variants": variants}
+
+    def lookup(self, path, refresh=False):
+        """Route for a request path, or None; refresh re-checks the manifest right away"""
+        now = time.monotonic()
+        if refresh or now - self._checked_at > self.RELOAD_INTERVAL:
+            with self._lock:
+                self._checked_at = now
+                self._reload()
+        return self._routes.get(path)
+
+def accepted_encodings(header):
+    """Content codings a client accepts, with their q-values (RFC 9110 Accept-Encoding)"""
+    accepted = {}
+    for item in header.split(","):
+        name, _, params = item.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[name] = quality
+    return accepted
+
+class StaticRequestHandler(BaseHTTPRequestHandler):
+    """Serves precompressed published files with sendfile"""
+
+    sites = None
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self._serve(send_body=True)
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def _serve(self, send_body, refreshed=False):
+        path = self.path.split("?", 1)[0]
+        route = self.sites.lookup(path, refresh=refreshed)
+        if route is None:
+            if not path.endswith("/") and self.sites.lookup(path + "/"):
+                # Relative asset URLs only resolve against the directory form
+                self.send_response(301)
+                self.send_header("Location", path + "/")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+            else:
+                self.send_error(404)
+            return
+        if self.headers.get("If-None-Match") == route["etag"]:
+            self.send_response(304)
+            self.send_header("ETag", route["etag"])
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        accepted = accepted_encodings(self.headers.get("Accept-Encoding", ""))
+        variants = route["variants"]
+        # Highest q-value wins; brotli first among equals as it is smaller
+        candidates = [
+            (accepted.get(name, accepted.get("*", 0.0)), -rank, name)
+            for rank, name in enumerate(("br", "gzip")) if name in variants
+        ]
+        quality, _, encoding = max(candidates, default=(0.0, 0, None))
+        if quality <= 0:
+            encoding = None
+        file_path, header_block, size = variants[encoding]
+        try:
+            with open(file_path, "rb") as f:
+                if os.fstat(f.fileno()).st_size != size:
+                    # The file is not the one the manifest describes; sending it
+                    # with these headers would break the response framing
+                    if refreshed:
+                        self.send_error(503)
+                        return
+                    raise FileNotFoundError(file_path)
+                self.wfile.write(header_block)
+                if send_body:
+                    self.wfile.flush()
+                    self.connection.sendfile(f)
+        except FileNotFoundError:
+            if refreshed:
+                self.send_error(404)
+            else:
+                # Published or pruned since the manifest was last read
+                self._serve(send_body, refreshed=True)
+
+    def log_message(self, format, *args):
+        # Access logging is left to whatever sits in front of this server
+        pass
+
+def nginx_config(publish_dir=None, port=None):
+    """Equivalent nginx server block, for serving without any Python at all"""
+    publish_dir = os.path.abspath(publish_dir or settings.PUBLISH_DIR)
+    port = port or settings.STATIC_PORT
+    return f"""server {{
+    listen {port};
+    root {publish_dir};
+    sendfile on;
+    tcp_nopush on;
+    gzip_static on;
+    # brotli_static on;  # needs ngx_brotli
+    location ~ ^/[^/]+/(index\\.html)?$ {{
+        add_header Cache-Control "public, max-age=0, must-revalidate";
+        try_files $uri $uri/index.html =404;
+    }}
+    location ~ ^/[^/]+/.+\\.[0-9a-f]{{12,16}}\\.|^/[^/]+/assets/ {{
+        add_header Cache-Control "public, max-age=31536000, immutable";
+    }}
+    location ~ ^/(manifest|sites|retired)\\.json {{
+        deny all;
+    }}
+}}
+"""
+
+def serve(host=None, port=None, publish_dir=None):
+    """Run the static server until interrupted"""
+    StaticRequestHandler.sites = PublishedSites(publish_dir)
+    server = ThreadingHTTPServer((host or settings.STATIC_HOST, port or settings.STATIC_PORT), StaticRequestHandler)
+    server.daemon_threads = True
+    print(f"Serving published sites from {StaticRequestHandler.sites.publish_dir} on port {server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve published sites")
+    parser.add_argument("--host", default=settings.STATIC_HOST)
+    parser.add_argument("--port", type=int, default=settings.STATIC_PORT)
+    parser.add_argument("--nginx-config", action="store_true", help="print an equivalent nginx config and exit")
+    args = parser.parse_args()
+    if args.nginx_config:
+        print(nginx_config(port=args.port))
+    else:
+        serve(args.host, args.port)
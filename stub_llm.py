@@ -0,0 +1,113 @@
+"""
+Local stand-in for the Groq client
+
+Selected with WEB_GEN_LLM_BACKEND=stub. It answers chat completions with a
+generated page after WEB_GEN_STUB_LLM_LATENCY seconds and streams it in
+chunks WEB_GEN_STUB_LLM_CHUNK_SECONDS apart, so the app and the load
+generator (loadtest.py) can run without network access or API keys.
+"""
+import hashlib
+import html
+import time
+from types import SimpleNamespace
+
+import settings
+
+class _StubStream:
+    """Iterates completion chunks the way groq.Stream does"""
+
+    def __init__(self, chunks, usage, latency, chunk_seconds):
+        self._chunks = chunks
+        self._usage = usage
+        self._latency = latency
+        self._chunk_seconds = chunk_seconds
+        self._closed = False
+
+    def __iter__(self):
+        time.sleep(self._latency)
+        for text in self._chunks:
+            if self._closed:
+                return
+            yield SimpleNamespace(
+                choices=[SimpleNamespace(delta=SimpleNamespace(content=text))],
+                x_groq=None
+            )
+            time.sleep(self._chunk_seconds)
+        yield SimpleNamespace(choices=[], x_groq=SimpleNamespace(usage=self._usage))
+
+    def close(self):
+        self._closed = True
+
+class _StubCompletions:
+
+    def __init__(self, client):
+        self._client = client
+
+    def create(self, messages, model=None, temperature=None, max_tokens=None, stream=False, **kwargs):
+        prompt = messages[-1]["content"] if messages else ""
+        html_content = self._client.render_page(prompt)
+        prompt_tokens = sum(len(m["content"]) for m in messages) // 4
+        completion_tokens = len(html_content) // 4
+        usage = SimpleNamespace(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            total_tokens=prompt_tokens + completion_tokens
+        )
+        if stream:
+            chunks = self._client.split_chunks(html_content)
+            return _StubStream(chunks, usage, self._client.latency, self._client.chunk_seconds)
+        time.sleep(self._client.latency + self._client.chunk_seconds * len(self._client.split_chunks(html_content)))
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=html_content))],
+            usage=usage
+        )
+
+class StubLLMClient:
+    """Fake chat completion client that returns deterministic pages for a prompt"""
+
+    def __init__(self, latency=None, chunk_seconds=None, sections=None):
+        self.latency = settings.STUB_LLM_LATENCY if latency is None else latency
+        self.chunk_seconds = settings.STUB_LLM_CHUNK_SECONDS if chunk_seconds is None else chunk_seconds
+        self.sections = settings.STUB_LLM_SECTIONS if sections is None else sections
+        self.chat = SimpleNamespace(completions=_StubCompletions(self))
+
+    def render_page(self, prompt):
+        """A complete page whose colours and text depend on the prompt"""
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        title = html.escape(prompt.strip().splitlines()[0][:60]) if prompt.strip() else "Stub page"
+        sections = "".join(
+            f"""
+    <section id="section-{i}" class="card">
+        <h2>Section {i + 1}</h2>
+        <p>{title} &mdash; placeholder copy for block {i + 1} ({digest[i * 4:i * 4 + 8]}).</p>
+        <button class="cta" data-section="{i}">Learn more</button>
+    </section>"""
+            for i in range(self.sections)
+        )
+        return f"""<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>{title}</title>
+    <style>
+        body {{ margin: 0; font-family: system-ui, sans-serif; background: #{digest[:6]}; }}
+        header {{ padding: 4rem 2rem; text-align: center; color: white; background: linear-gradient(135deg, #{digest[6:12]}, #{digest[12:18]}); }}
+        .card {{ margin: 2rem auto; max-width: 720px; padding: 2rem; background: white; border-radius: 1rem; animation: fade-in 0.6s ease; }}
+        .cta {{ padding: 0.5rem 1rem; border: 0; border-radius: 0.5rem; background: #{digest[18:24]}; color: white; }}
+        @keyframes fade-in {{ from {{ opacity: 0; }} to {{ opacity: 1; }} }}
+    </style>
+</head>
+<body>
+    <header><h1>{title}</h1></header>{sections}
+    <script>
+        document.querySelectorAll(".cta").forEach(function (button) {{
+            button.addEventListener("click", function () {{ button.textContent = "Thanks!"; }});
+        }});
+    </script>
+</body>
+</html>"""
+
+    @staticmethod
+    def split_chunks(text, size=64):
+        return [text[i:i + size] for i in range(0, len(text), size)]
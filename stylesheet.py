@@ -0,0 +1,76 @@
+import hashlib
+import os
+import re
+import tempfile
+import threading
+
+import streamlit as st
+
+import settings
+from factory import BaseModel
+from minify import minify_css
+
+class StyleBundle(BaseModel):
+    """App CSS from every registered view, minified and content-hashed once per process"""
+
+    STYLE_BLOCK = re.compile(r"<style[^>]*>(.*?)</style>", re.S | re.I)
+
+    def __init__(self, static_dir=None, url_prefix=None):
+        self.static_dir = static_dir or settings.STATIC_DIR
+        self.url_prefix = url_prefix or settings.STATIC_URL_PREFIX
+        self._lock = threading.Lock()
+        self._version = None
+        self._sheets = {}
+
+    def _css(self, block):
+        """Bare CSS from a view's contribution, with or without <style> tags"""
+        blocks = self.STYLE_BLOCK.findall(block)
+        return "\n".join(blocks) if blocks else block
+
+    def _write(self, name, css):
+        path = os.path.join(self.static_dir, name)
+        if os.path.exists(path):
+            return
+        os.makedirs(self.static_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.static_dir, prefix=".tmp-")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(css)
+        os.replace(tmp_path, path)
+
+    def _build(self, view_factory):
+        styles = view_factory.collect_styles()
+        shared = [self._css(block) for block in styles.pop("main", [])]
+        sheets = {}
+        for page in set(styles) | {"chat"}:
+            css = minify_css("\n".join(shared + [self._css(block) for block in styles.get(page, [])]))
+            digest = hashlib.sha256(css.encode("utf-8")).hexdigest()[:12]
+            name = f"styles.{page}.{digest}.css"
+            try:
+                self._write(name, css)
+            except OSError:
+                # Unwritable static folder; the sheet is inlined instead
+                name = None
+            sheets[page] = (name, css)
+        return sheets
+
+    def stylesheet(self, page):
+        """(file name or None, minified CSS) for a page, rebuilt only when views change"""
+        # Imported here to avoid circular imports
+        from factory import app_factory
+
+        view_factory = app_factory.view_factory
+        with self._lock:
+            if self._version != view_factory.version:
+                self._sheets = self._build(view_factory)
+                self._version = view_factory.version
+            return self._sheets.get(page) or self._sheets["chat"]
+
+    def tag(self, page):
+        """Markup that applies a page's styles: a cached <link> when possible, else a <style> block"""
+        name, css = self.stylesheet(page)
+        # Browsers only apply the sheet if it is served as text/css; the
+        # Streamlit floor in requirements.txt is a release verified to do so
+        # (older static handlers sent unknown types as text/plain, nosniff)
+        if name and st.get_option("server.enableStaticServing"):
+            return f'<link rel="stylesheet" href="{self.url_prefix}{name}">'
+        return f"<style>{css}</style>"
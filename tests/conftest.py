@@ -0,0 +1,11 @@
+import os
+import sys
+import tempfile
+
+# Settings are read at import time, so point them at a scratch directory first
+os.environ.setdefault("WEB_GEN_DATA_DIR", tempfile.mkdtemp(prefix="web-gen-tests-"))
+os.environ.setdefault("WEB_GEN_LLM_BACKEND", "stub")
+os.environ.setdefault("WEB_GEN_OPEN_IN_BROWSER", "0")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import factory  # noqa: E402,F401  (registers the models before they are imported directly)
@@ -0,0 +1,31 @@
+import multiprocessing
+
+from assets import AssetCache
+
+def _put_many(cache_dir, worker, count):
+    cache = AssetCache(cache_dir, fetch=False)
+    for n in range(count):
+        cache.put(f"https://cdn.example/{worker}/{n}.css", f"/* {worker} {n} */".encode())
+
+def test_concurrent_workers_keep_each_others_index_entries(tmp_path):
+    cache_dir = str(tmp_path)
+    workers = [multiprocessing.Process(target=_put_many, args=(cache_dir, worker, 25)) for worker in range(4)]
+    for process in workers:
+        process.start()
+    for process in workers:
+        process.join()
+
+    cache = AssetCache(cache_dir, fetch=False)
+    for worker in range(4):
+        for n in range(25):
+            data, mime, _ = cache.get(f"https://cdn.example/{worker}/{n}.css")
+            assert data == f"/* {worker} {n} */".encode()
+            assert mime == "text/css"
+
+def test_put_keeps_entries_a_stale_instance_never_saw(tmp_path):
+    first, second = AssetCache(str(tmp_path), fetch=False), AssetCache(str(tmp_path), fetch=False)
+    first.put("https://cdn.example/a.css", b"a{}")
+    second.put("https://cdn.example/b.css", b"b{}")
+    fresh = AssetCache(str(tmp_path), fetch=False)
+    assert fresh.get("https://cdn.example/a.css")[0] == b"a{}"
+    assert fresh.get("https://cdn.example/b.css")[0] == b"b{}"
@@ -0,0 +1,44 @@
+from models import ContextBuilder, HTMLGenerator, Message
+
+def _page(sections):
+    body = "".join(
+        f'<section id="s{n}"><h2>Section {n}</h2><p>{"Lorem ipsum dolor sit amet. " * 20}</p></section>'
+        for n in range(sections)
+    )
+    return f"<!DOCTYPE html><html><head><title>Bakery</title></head><body><h1>Fresh bread</h1>{body}</body></html>"
+
+def _budget(messages, builder):
+    return sum(builder._message_tokens(message) for message in messages)
+
+def test_small_page_is_sent_whole():
+    builder = ContextBuilder()
+    html = _page(2)
+    messages = builder.build_messages("system", [], "Make it blue", html)
+    assert html in messages[-2]["content"]
+    assert messages[-1]["content"].startswith("Update the website above")
+
+def test_large_page_is_rebuilt_from_outline_within_budget():
+    builder = ContextBuilder()
+    html = _page(60)
+    history = [Message("user", "Create a bakery website"), Message("assistant", "Done")]
+    messages = builder.build_messages("system", history, "Add a dark mode", html)
+    assert messages is not None
+    assert html not in "".join(message["content"] for message in messages)
+    outline = messages[-2]["content"]
+    assert "title: Bakery" in outline and '<section id="s0">' in outline
+    assert "Add a dark mode" in messages[-1]["content"]
+    assert "Create a bakery website" in "".join(message["content"] for message in messages)
+    assert _budget(messages, builder) <= builder.token_budget
+
+def test_generator_budget_follows_context_window():
+    generator = HTMLGenerator()
+    assert generator.context_builder.token_budget == HTMLGenerator.CONTEXT_WINDOW - HTMLGenerator.MAX_TOKENS
+    # A page over 10K characters still fits whole
+    html = _page(17)
+    assert len(html) > 10000
+    messages = generator.context_builder.build_messages("system", [], "Make it blue", html)
+    assert html in messages[-2]["content"]
+
+def test_dense_text_is_not_underestimated():
+    builder = ContextBuilder()
+    assert builder.estimate_tokens("A" * 3000) >= 1000
@@ -0,0 +1,87 @@
+import threading
+
+import pytest
+
+from jobs import JobExecutor
+
+@pytest.fixture
+def executor():
+    return JobExecutor(max_workers=2, abandon_after=60, retain_for=60)
+
+def _wait(executor, job_id, timeout=5):
+    event = threading.Event()
+    for _ in range(int(timeout / 0.01)):
+        job = executor.get(job_id)
+        if not job.active:
+            return job
+        event.wait(0.01)
+    raise AssertionError("job did not finish")
+
+def _streaming_task(release, chunks=("<html>", "<body>", "</body></html>")):
+    def task(cancel_event, on_chunk):
+        for chunk in chunks:
+            on_chunk(chunk)
+        release.wait(5)
+        if cancel_event.is_set():
+            return None, "Generation cancelled"
+        return "".join(chunks), None
+    return task
+
+def test_job_exposes_streamed_text_and_result(executor):
+    release = threading.Event()
+    job_id = executor.submit("s", "update", "prompt", _streaming_task(release))
+    for _ in range(500):
+        if executor.get(job_id).partial_chars == 26:
+            break
+        threading.Event().wait(0.01)
+    assert executor.get(job_id).partial_text == "<html><body></body></html>"
+    release.set()
+    job = _wait(executor, job_id)
+    assert job.status == "done" and job.result == "<html><body></body></html>"
+
+def test_new_request_supersedes_the_sessions_running_job(executor):
+    release = threading.Event()
+    first = executor.submit("s", "update", "one", _streaming_task(release))
+    second = executor.submit("s", "update", "two", lambda cancel_event, on_chunk: ("<html>two</html>", None))
+    release.set()
+    assert _wait(executor, first).status == "cancelled"
+    assert executor.get(first).error == "Superseded by a newer request"
+    assert _wait(executor, second).status == "done"
+
+def test_other_sessions_are_not_superseded(executor):
+    release = threading.Event()
+    first = executor.submit("a", "update", "one", _streaming_task(release))
+    second = executor.submit("b", "update", "two", _streaming_task(release))
+    release.set()
+    assert _wait(executor, first).status == "done"
+    assert _wait(executor, second).status == "done"
+
+def test_cancel_sets_the_event_the_task_sees(executor):
+    release = threading.Event()
+    job_id = executor.submit("s", "generate", "prompt", _streaming_task(release))
+    executor.cancel(job_id)
+    release.set()
+    job = _wait(executor, job_id)
+    assert job.status == "cancelled" and job.cancel_event.is_set()
+
+def test_queued_job_cancelled_before_it_starts_never_runs():
+    executor = JobExecutor(max_workers=1, abandon_after=60, retain_for=60)
+    release = threading.Event()
+    ran = []
+    blocker = executor.submit("a", "generate", "busy", _streaming_task(release))
+    queued = executor.submit("b", "generate", "queued", lambda cancel_event, on_chunk: ran.append(1) or ("x", None))
+    executor.cancel(queued)
+    assert executor.get(queued).status == "cancelled"
+    release.set()
+    _wait(executor, blocker)
+    assert ran == []
+
+def test_abandoned_jobs_are_reaped():
+    executor = JobExecutor(max_workers=1, abandon_after=0.01, retain_for=60)
+    release = threading.Event()
+    job_id = executor.submit("s", "generate", "prompt", _streaming_task(release))
+    threading.Event().wait(0.05)
+    executor.reap()
+    release.set()
+    job = _wait(executor, job_id)
+    assert job.status == "cancelled" and job.error == "Abandoned"
@@ -0,0 +1,20 @@
+from memory_budget import MemoryBudget
+
+def test_session_overflow_keeps_payloads_other_sessions_hold():
+    budget = MemoryBudget(session_bytes=100, process_bytes=10_000)
+    budget.track("html:shared", 80, "b")
+    budget.track("html:shared", 80, "a")
+    budget.track("html:own", 80, "a")
+
+    assert budget.session_overflow("a") == []
+    # Session a no longer pays for the shared body, and b still holds it
+    assert budget.session_usage("a") == 80
+    assert budget.session_usage("b") == 80
+    assert budget.session_overflow("b") == []
+
+def test_session_overflow_evicts_sole_owned_payloads_oldest_first():
+    budget = MemoryBudget(session_bytes=100, process_bytes=10_000)
+    budget.track("html:old", 80, "a")
+    budget.track("html:new", 80, "a")
+    assert budget.session_overflow("a") == ["html:old"]
+    assert budget.session_overflow("a", pinned={"html:old"}) == ["html:new"]
@@ -0,0 +1,32 @@
+from minify import minify_css, minify_js
+
+def test_css_whitespace_and_comments_are_removed():
+    css = "/* theme */\nbody {\n  color : red;\n  margin: 0 auto;\n}\n\na :hover , b > c { top: 0; }"
+    assert minify_css(css) == "body{color :red;margin:0 auto}a :hover,b>c{top:0}"
+
+def test_css_quoted_strings_are_left_alone():
+    css = 'a::before { content: "Price: $5 ; {x} /* not a comment */"; }\nb { font-family: \'Open  Sans\', serif; }'
+    assert minify_css(css) == (
+        'a::before{content:"Price: $5 ; {x} /* not a comment */"}'
+        "b{font-family:'Open  Sans',serif}"
+    )
+
+def test_js_comments_are_removed_but_lines_kept():
+    js = "// setup\nconst a = 1; // trailing\n\n  /* block\n  comment */\n  let b = a /* inline */ + 2;\n"
+    assert minify_js(js) == "const a = 1;\nlet b = a  + 2;"
+
+def test_js_comment_markers_inside_strings_survive():
+    js = 'input.accept = "image/*"; const y = 2; /* note */\nconst url = \'http://example.com\';'
+    assert minify_js(js) == 'input.accept = "image/*"; const y = 2;\nconst url = \'http://example.com\';'
+
+def test_js_template_literals_are_copied_verbatim():
+    js = "const t = `line one\n    /* kept */ ${items.map(i => `<li>${i}</li>`).join('')}\n  // kept too`;\nconst z = {a: 1}; // gone"
+    assert minify_js(js) == (
+        "const t = `line one\n    /* kept */ ${items.map(i => `<li>${i}</li>`).join('')}\n  // kept too`;\n"
+        "const z = {a: 1};"
+    )
+
+def test_js_regex_literals_are_not_comments():
+    js = "const re = /\\/*[a-z]+/g; // strip\nconst half = total / 2; /* done */"
+    assert minify_js(js) == "const re = /\\/*[a-z]+/g;\nconst half = total / 2;"
+    assert minify_js("if (ok) return /\\/\\//.test(s);") == "if (ok) return /\\/\\//.test(s);"
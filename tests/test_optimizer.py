@@ -0,0 +1,42 @@
+from optimizer import HTMLOptimizer
+
+PAGE = """<!DOCTYPE html><html><head><style>
+.menu { display: none; }
+.menu.open { display: block; }
+.hidden { visibility: hidden; }
+.unused { color: red; }
+.card { animation: fade 1s; }
+@keyframes fade { from { opacity: 0; } to { opacity: 1; } }
+@keyframes spin { to { transform: rotate(1turn); } }
+.card { animation: fade 1s; }
+</style></head><body>
+<button onclick="document.querySelector('.menu').classList.toggle('open')">Menu</button>
+<ul class="menu"><li>Home</li></ul>
+<p class="card" data-hide-target=".hidden">Fresh bread daily <noscript>(enable JS)</noscript> and cakes <script>var x = 1;</script> too</p>
+</body></html>"""
+
+def test_rules_used_only_from_attributes_are_kept():
+    html, report = HTMLOptimizer().optimize(PAGE)
+    assert ".menu.open{display:block}" in html
+    assert ".hidden{visibility:hidden}" in html
+    assert ".unused" not in html
+    assert "@keyframes spin" not in html and "@keyframes fade" in html
+    assert report["removed_rules"] == 1 and report["removed_keyframes"] == 1
+
+def test_stored_copy_keeps_every_rule_but_drops_duplicates():
+    html, report = HTMLOptimizer().optimize(PAGE, prune=False)
+    assert ".unused{color:red}" in html and "@keyframes spin" in html
+    assert html.count(".card{animation:fade 1s}") == 1
+    assert report["removed_rules"] == 0 and report["duplicate_rules"] == 1
+
+def test_inline_script_and_noscript_keep_the_space_around_them():
+    html, _ = HTMLOptimizer().optimize(PAGE)
+    assert "daily <noscript>(enable JS)</noscript> and cakes <script>" in html
+    assert "</script> too</p>" in html
+
+def test_pruned_and_stored_copies_are_cached_separately():
+    optimizer = HTMLOptimizer()
+    pruned, _ = optimizer.optimize(PAGE)
+    stored, _ = optimizer.optimize(PAGE, prune=False)
+    assert pruned != stored
+    assert optimizer.optimize(PAGE, prune=False)[1]["cached"]
@@ -0,0 +1,37 @@
+from preview import PreviewPatcher
+
+PAGE = (
+    "<!DOCTYPE html><html><head><style>{css}</style></head><body>\n"
+    "<header id=\"top\"><h1>Bakery</h1></header>\r\n<main><p>{text}</p></main>\n"
+    "<script>document.getElementById('top').onclick = () => {{}};</script></body></html>"
+)
+
+def test_text_change_patches_one_block():
+    patcher = PreviewPatcher()
+    ops = patcher.diff(PAGE.format(css="p{}", text="Fresh"), PAGE.format(css="p{}", text="Warm"))
+    assert ops == [{"op": "block", "index": 1, "tag": "main", "html": "<main><p>Warm</p></main>"}]
+
+def test_style_change_sends_only_the_page_styles():
+    patcher = PreviewPatcher()
+    ops = patcher.diff(PAGE.format(css="p{color:red}", text="x"), PAGE.format(css="p{color:blue}", text="x"))
+    assert ops == [{"op": "styles", "css": ["p{color:blue}"]}]
+
+def test_blocks_scripts_hook_into_need_a_reload():
+    patcher = PreviewPatcher()
+    old = PAGE.format(css="", text="x")
+    new = old.replace("<h1>Bakery</h1>", "<h1>Bread</h1>")
+    assert patcher.diff(old, new) == [{"op": "reload", "html": new}]
+
+def test_streamed_document_is_appended_in_order():
+    patcher = PreviewPatcher()
+    text = "```html\n<!DOCTYPE html><html><body><h1>Hi"
+    first = patcher.append(text, 0)
+    assert first == [{"op": "append", "html": "<!DOCTYPE html><html><body><h1>Hi", "open": True}]
+    more = text + "</h1></body>"
+    assert patcher.append(more, len(text)) == [{"op": "append", "html": "</h1></body>", "open": False}]
+    assert patcher.append(more, len(more)) == []
+
+def test_streamed_fragments_are_not_rendered():
+    patcher = PreviewPatcher()
+    assert patcher.document_start('<section id="menu"><h2>Menu</h2>') is None
+    assert patcher.append('<section id="menu"><h2>Menu</h2>', 0) == []
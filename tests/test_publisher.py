@@ -0,0 +1,74 @@
+import http.client
+import os
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from publisher import StaticPublisher
+from static_server import PublishedSites, StaticRequestHandler, accepted_encodings
+
+PAGE = "<!DOCTYPE html><html><head><title>{0}</title><style>body{{color:{0}}}</style></head><body><h1>{0}</h1></body></html>"
+
+def _files(publish_dir, site_id):
+    return {
+        os.path.join(root, name)
+        for root, _, names in os.walk(os.path.join(publish_dir, site_id)) for name in names
+    }
+
+@pytest.fixture
+def server(tmp_path):
+    handler = type("Handler", (StaticRequestHandler,), {"sites": PublishedSites(str(tmp_path))})
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield handler.sites, httpd.server_port
+    httpd.shutdown()
+    httpd.server_close()
+
+def _get(port, path, accept_encoding=None):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+    conn.request("GET", path, headers={"Accept-Encoding": accept_encoding} if accept_encoding else {})
+    response = conn.getresponse()
+    body = response.read()
+    conn.close()
+    return response, body
+
+def test_server_on_the_previous_manifest_keeps_serving_the_previous_version(tmp_path, server):
+    sites, port = server
+    publisher = StaticPublisher(str(tmp_path), retain_seconds=60)
+    publisher.publish("site", PAGE.format("red"))
+    sites.lookup("/site/", refresh=True)
+    old_route = sites.lookup("/site/")
+
+    publisher.publish("site", PAGE.format("blue"))
+    # The server has not reloaded yet: its route still points at complete v1 files
+    file_path, _, size = old_route["variants"][None]
+    assert os.path.getsize(file_path) == size
+    sites._routes["/site/"] = old_route
+    response, body = _get(port, "/site/")
+    assert response.status == 200 and b"red" in body
+
+    sites.lookup("/site/", refresh=True)
+    response, body = _get(port, "/site/")
+    assert response.status == 200 and b"blue" in body
+
+def test_replaced_files_are_pruned_only_after_the_retention_period(tmp_path):
+    publisher = StaticPublisher(str(tmp_path), retain_seconds=60)
+    publisher.publish("site", PAGE.format("red"))
+    first = _files(str(tmp_path), "site")
+    publisher.publish("site", PAGE.format("blue"))
+    assert first <= _files(str(tmp_path), "site")
+
+    publisher.retain_seconds = 0
+    publisher.publish("site", PAGE.format("green"))
+    remaining = _files(str(tmp_path), "site")
+    assert not any("red" in open(path, "rb").read().decode("latin-1") for path in remaining if path.endswith((".html", ".css")))
+
+def test_accept_encoding_q_values(tmp_path, server):
+    sites, port = server
+    StaticPublisher(str(tmp_path)).publish("site", PAGE.format("red"))
+    sites.lookup("/site/", refresh=True)
+    assert _get(port, "/site/", "gzip, br")[0].getheader("Content-Encoding") in ("br", "gzip")
+    assert _get(port, "/site/", "gzip;q=0, identity")[0].getheader("Content-Encoding") is None
+    assert _get(port, "/site/", "br;q=0, gzip;q=0.5")[0].getheader("Content-Encoding") == "gzip"
+    assert accepted_encodings("gzip;q=0.2, br ; q=0, *;q=0.1") == {"gzip": 0.2, "br": 0.0, "*": 0.1}
@@ -0,0 +1,55 @@
+import pytest
+
+from section_index import SectionIndexer
+
+PAGE = (
+    "<!DOCTYPE html><html><head><title>Bakery</title><style>"
+    "#about{padding:1rem}.price{color:green}footer{font-size:small}nav a{color:red}</style></head><body>\r\n"
+    '<nav><a href="#about">About</a> <a href="#menu">Menu</a></nav>\r\n'
+    "<header><h1>Fresh Bread</h1></header>\r"
+    '<section id="about"><h2>About us</h2><p>Family bakery since 1920</p></section>\f\n'
+    '<section id="menu"><h2>Our menu</h2><p class="price">Bread $3</p></section>\n'
+    "<footer><p>Copyright 2024</p></footer>\n"
+    "</body></html>"
+)
+
+@pytest.fixture
+def indexer():
+    return SectionIndexer()
+
+def _resolve(indexer, prompt):
+    section = indexer.resolve(indexer.index(PAGE), prompt)
+    return PAGE[section["start"]:section["end"]] if section else None
+
+def test_named_sections_resolve_to_their_exact_span(indexer):
+    assert _resolve(indexer, "Change the about section text") == (
+        '<section id="about"><h2>About us</h2><p>Family bakery since 1920</p></section>'
+    )
+    assert _resolve(indexer, "Make the menu prices bigger").startswith('<section id="menu">')
+    assert _resolve(indexer, "Make the footer text smaller") == "<footer><p>Copyright 2024</p></footer>"
+
+@pytest.mark.parametrize("prompt", [
+    "Add a pricing section",
+    "add a testimonials section after the menu",
+    "Insert a gallery before the footer",
+    "Change the section background",
+    "Change the page title",
+    "Make the whole page dark mode",
+])
+def test_requests_not_about_one_existing_element_are_full_edits(indexer, prompt):
+    assert _resolve(indexer, prompt) is None
+    assert indexer.plan_edit(PAGE, prompt) is None
+
+def test_plan_carries_only_the_css_that_applies(indexer):
+    plan = indexer.plan_edit(PAGE, "Make the menu prices bigger")
+    assert plan["css"] == ".price{color:green}"
+
+def test_apply_edit_splices_the_element_and_appends_changed_rules(indexer):
+    plan = indexer.plan_edit(PAGE, "Make the footer text smaller")
+    output = "```html\n<footer><p>&copy; 2024</p></footer>\n<style>footer{font-size:x-small}</style>\n```"
+    html = indexer.apply_edit(PAGE, plan, output)
+    assert "<footer><p>&copy; 2024</p></footer>" in html and "Copyright" not in html
+    assert "nav a{color:red}footer{font-size:x-small}</style>" in html
+    assert html.replace("<footer><p>&copy; 2024</p></footer>", "").replace("footer{font-size:x-small}", "") == (
+        PAGE.replace("<footer><p>Copyright 2024</p></footer>", "")
+    )
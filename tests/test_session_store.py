@@ -0,0 +1,49 @@
+from memory_budget import MemoryBudget
+from models import Message
+from session_store import SessionStore
+
+def _stores(tmp_path):
+    db_path = str(tmp_path / "sessions.db")
+    return SessionStore(db_path, budget=MemoryBudget()), SessionStore(db_path, budget=MemoryBudget())
+
+def test_resident_session_reloads_after_another_worker_writes(tmp_path):
+    first, second = _stores(tmp_path)
+    session_id = first.create_session()
+    first.load_session(session_id).add_message(Message("user", "Create a bakery site"))
+
+    other = second.load_session(session_id)
+    other.add_message(Message("assistant", "Here it is"))
+    other.current_html = "<html>v1</html>"
+    other.save()
+
+    session = first.load_session(session_id)
+    assert [message.content for message in session.messages] == ["Create a bakery site", "Here it is"]
+    assert session.current_html == "<html>v1</html>"
+
+def test_stale_save_keeps_the_other_workers_changes(tmp_path):
+    first, second = _stores(tmp_path)
+    session_id = first.create_session()
+    stale = first.load_session(session_id)
+
+    other = second.load_session(session_id)
+    other.add_message(Message("user", "Add a menu"))
+    other.current_html = "<html>v2</html>"
+    other.save()
+
+    # This worker only changes a flag; the page and messages written meanwhile survive
+    stale.show_results = True
+    stale.save()
+
+    fresh = SessionStore(first.db_path, budget=MemoryBudget()).load_session(session_id)
+    assert fresh.show_results is True
+    assert fresh.current_html == "<html>v2</html>"
+    assert [message.content for message in fresh.messages] == ["Add a menu"]
+
+def test_own_writes_keep_the_session_resident(tmp_path):
+    store, _ = _stores(tmp_path)
+    session_id = store.create_session()
+    session = store.load_session(session_id)
+    session.add_message(Message("user", "Hello"))
+    session.show_results = True
+    session.save()
+    assert store.load_session(session_id) is session
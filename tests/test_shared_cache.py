@@ -0,0 +1,72 @@
+import threading
+
+import pytest
+
+from models import HTMLGenerator
+from shared_cache import SharedRateLimiter, SharedResponseCache
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "shared.db")
+
+def test_only_one_worker_holds_a_claim(db_path):
+    first, second = SharedResponseCache(db_path), SharedResponseCache(db_path)
+    assert first.owner != second.owner
+    assert first.claim("key")
+    assert not second.claim("key")
+    first.release("key")
+    assert second.claim("key")
+
+def test_release_leaves_another_workers_claim_alone(db_path):
+    first, second = SharedResponseCache(db_path, inflight_timeout=0.01), SharedResponseCache(db_path)
+    assert first.claim("key")
+    threading.Event().wait(0.05)
+    # First's claim expired and second took over; first's late release must not drop it
+    assert second.claim("key")
+    first.release("key")
+    assert not first.claim("key")
+
+def test_put_publishes_the_result_to_waiters(db_path):
+    first, second = SharedResponseCache(db_path), SharedResponseCache(db_path)
+    assert first.claim("key")
+    threading.Timer(0.1, first.put, ("key", "<html></html>")).start()
+    assert second.wait_for("key", poll_interval=0.02) == "<html></html>"
+    assert second.get("key") == "<html></html>"
+
+def test_wait_for_returns_none_when_the_owner_gives_up(db_path):
+    first, second = SharedResponseCache(db_path), SharedResponseCache(db_path)
+    assert first.claim("key")
+    threading.Timer(0.1, first.release, ("key",)).start()
+    assert second.wait_for("key", poll_interval=0.02) is None
+
+class _FailingCompletions:
+    def __init__(self, fail_on_create):
+        self.fail_on_create = fail_on_create
+
+    def create(self, **request):
+        if self.fail_on_create:
+            raise ConnectionError("upstream down")
+        return _FailingStream()
+
+class _FailingStream:
+    def __iter__(self):
+        raise ConnectionError("stream reset")
+
+    def close(self):
+        pass
+
+class _FailingClient:
+    def __init__(self, fail_on_create):
+        self.chat = type("Chat", (), {"completions": _FailingCompletions(fail_on_create)})()
+
+@pytest.mark.parametrize("fail_on_create", [True, False])
+def test_upstream_errors_refund_the_rate_limit_estimate(db_path, fail_on_create):
+    generator = HTMLGenerator()
+    generator.rate_limiter = SharedRateLimiter(db_path, tokens_per_minute=100_000)
+    generator.client = _FailingClient(fail_on_create)
+    messages = [{"role": "user", "content": "Create a bakery site"}]
+    with pytest.raises(ConnectionError):
+        generator._complete(messages)
+    prompt_tokens = generator.context_builder.estimate_tokens(messages[0]["content"])
+    spent = 0 if fail_on_create else prompt_tokens
+    assert generator.rate_limiter.available() >= 100_000 - spent - 1
@@ -0,0 +1,56 @@
+import threading
+
+from speculation import SpeculativeEditor
+
+class _FullBucket:
+    capacity = 1000
+
+    def available(self):
+        return 1000
+
+def _editor():
+    editor = SpeculativeEditor(enabled=True, per_session=2, max_sessions=4, min_slack=0.5, max_prompt_words=8)
+    editor.rate_limiter = _FullBucket()
+    return editor
+
+def _wait_idle(editor):
+    done = threading.Event()
+    editor._pool.submit(done.set)
+    assert done.wait(5)
+
+def test_matching_follow_up_is_served_for_the_same_page():
+    editor = _editor()
+    editor.speculate("s", "<html>v1</html>", lambda prompt: lambda cancel_event, on_chunk: (f"<html>{prompt}</html>", None))
+    _wait_idle(editor)
+    assert editor.take("s", "<html>v1</html>", "add dark mode") == "<html>Add a dark mode to the website</html>"
+    assert editor.get_metrics()["hits"] == 1
+
+def test_changed_page_or_negated_request_is_a_miss():
+    editor = _editor()
+    make_task = lambda prompt: lambda cancel_event, on_chunk: ("<html>dark</html>", None)
+    editor.speculate("s", "<html>v1</html>", make_task)
+    _wait_idle(editor)
+    assert editor.take("s", "<html>v2</html>", "add dark mode") is None
+    editor.speculate("s", "<html>v1</html>", make_task)
+    _wait_idle(editor)
+    assert editor.take("s", "<html>v1</html>", "remove the dark mode") is None
+
+def test_discarded_speculations_are_cancelled_before_they_run():
+    editor = _editor()
+    release = threading.Event()
+    started = []
+
+    def make_task(prompt):
+        def task(cancel_event, on_chunk):
+            started.append(prompt)
+            release.wait(5)
+            return "<html>x</html>", None
+        return task
+
+    editor.speculate("s", "<html>v1</html>", make_task)
+    # The page changes while the first follow-up is still running
+    editor.take("s", "<html>v1</html>", "something else entirely")
+    release.set()
+    _wait_idle(editor)
+    assert len(started) <= 1
+    assert editor.get_metrics()["ready"] == 0
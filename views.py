@@ -1,10 +1,26 @@
+import os
 import streamlit as st
 import streamlit.components.v1 as components
 from factory import BaseView
 
+# Custom component that keeps one preview iframe alive and patches it in place
+_live_preview = components.declare_component(
+    "live_preview",
+    path=os.path.join(os.path.dirname(os.path.abspath(__file__)), "preview_component")
+)
+
 class CSSStyles(BaseView):
     """Contains all CSS styling for the application"""
     
+    @classmethod
+    def get_styles(cls):
+        """Bundled into one stylesheet per page by StyleBundle"""
+        return {
+            "main": cls.get_main_styles(),
+            "results": cls.get_results_styles(),
+            "published": cls.get_published_styles(),
+        }
+    
     @staticmethod
     def get_main_styles():
         return """
@@ -289,6 +305,23 @@ class ChatView(BaseView):
         st.markdown('</div>', unsafe_allow_html=True)
         return user_input, submit_button
 
+    @staticmethod
+    def display_job_status(job):
+        """Display progress of a background generation; returns True if cancel was clicked"""
+        action = "Generating" if job.kind == "generate" else "Updating"
+        if job.status == "queued":
+            detail = "waiting for a free worker"
+        elif job.partial_chars:
+            detail = f"{job.partial_chars:,} characters received"
+        else:
+            detail = "waiting for the model"
+        
+        col1, col2 = st.columns([4, 1])
+        with col1:
+            st.info(f"🤖 {action} your website... ({detail})")
+        with col2:
+            return st.button("✖ Cancel", key="cancel_job_button")
+
 class ResultsView(BaseView):
     """Handles results page display"""
     
@@ -324,7 +357,7 @@ class ResultsView(BaseView):
         return user_input, continue_button
     
     @staticmethod
-    def display_results_column(html_content, on_publish, on_download):
+    def display_results_column(html_content, on_publish, on_download, on_bundle=None, on_preview=None):
         """Display the results column in results view"""
         # Header with Publish button
         col_header1, col_header2 = st.columns([3, 1])
@@ -342,7 +375,10 @@ class ResultsView(BaseView):
         if html_content:
             # Display the generated HTML
             try:
-                components.html(html_content, height=800, width=1000, scrolling=True)
+                if on_preview:
+                    on_preview(html_content)
+                else:
+                    components.html(html_content, height=800, width=1000, scrolling=True)
             except Exception as e:
                 st.error(f"Error rendering HTML: {str(e)}")
                 st.info("HTML content is available for download below.")
@@ -351,15 +387,26 @@ class ResultsView(BaseView):
             st.markdown('<div class="download-section">', unsafe_allow_html=True)
             st.markdown("**📥 Download Options**")
             
-            # Download button
+            # Download payloads are passed as callables so they are only
+            # produced when the user actually clicks
             try:
                 st.download_button(
                     label="📥 Download HTML File",
-                    data=html_content,
+                    data=lambda: html_content,
                     file_name=on_download(),
                     mime="text/html",
                     key="download_btn_results"
                 )
+                if on_bundle:
+                    bundle_name, bundle_data = on_bundle()
+                    st.download_button(
+                        label="📦 Download Site Bundle (.zip)",
+                        data=bundle_data,
+                        file_name=bundle_name,
+                        mime="application/zip",
+                        key="download_bundle_results",
+                        help="index.html with separate minified CSS/JS and gzip variants"
+                    )
             except Exception as e:
                 st.error(f"Error creating download button: {str(e)}")
             
@@ -367,6 +414,21 @@ class ResultsView(BaseView):
         else:
             st.info("No website generated yet. Start a conversation to see results here.")
 
+class LivePreviewView(BaseView):
+    """Handles the in-place patched website preview"""
+    
+    @staticmethod
+    def display_live_preview(ops, revision, base_revision, height=800):
+        """Send preview updates to the live preview frame"""
+        _live_preview(
+            ops=ops,
+            revision=revision,
+            base_revision=base_revision,
+            height=height,
+            key="live_preview_frame",
+            default=None
+        )
+
 class PublishedView(BaseView):
     """Handles published page display"""
     
@@ -381,9 +443,13 @@ class PublishedView(BaseView):
         return st.button("← Back to Editor", key="back_to_editor")
     
     @staticmethod
-    def display_published_website(html_content):
+    def display_published_website(html_content, site=None):
         """Display the published website"""
-        if html_content:
+        if site:
+            # Load the page from the static server, not through Streamlit
+            st.markdown(f"🔗 Live at [{site['url']}]({site['url']}) · published {site['published_at']}")
+            components.iframe(site["url"], height=800, width=1400, scrolling=True)
+        elif html_content:
             try:
                 components.html(html_content, height=800, width=1400, scrolling=True)
             except Exception as e:
@@ -403,3 +469,40 @@ class FooterView(BaseView):
             A prototype of a website builder ❤️ 
         </div>
         """, unsafe_allow_html=True)
+    
+    @staticmethod
+    def display_metrics(title, metrics):
+        """Display a block of runtime metrics for operators"""
+        with st.expander(f"📊 {title}"):
+            st.json(metrics)
+    
+    @staticmethod
+    def display_profiles(runs):
+        """Display the slowest profiled reruns and where they allocated memory"""
+        with st.expander("⏱️ Profiled reruns"):
+            if not runs:
+                st.caption("No profiled reruns yet. Add ?profile=1 to the URL to profile this session.")
+                return
+            st.dataframe(
+                [
+                    {
+                        "run": run["run_id"],
+                        "session": run["session_id"][:8],
+                        "ms": round(run["duration"] * 1000, 1),
+                        "peak KiB": round(run["peak_bytes"] / 1024),
+                        "reason": run["reason"],
+                        "outcome": run["outcome"],
+                    }
+                    for run in runs
+                ],
+                hide_index=True
+            )
+            selected = st.selectbox("Run", [run["run_id"] for run in runs], key="profile_run")
+            run = next(run for run in runs if run["run_id"] == selected)
+            col1, col2 = st.columns(2)
+            with col1:
+                st.markdown("**Top functions (cumulative)**")
+                st.dataframe(run["functions"], hide_index=True)
+            with col2:
+                st.markdown("**Top allocators**")
+                st.dataframe(run["allocators"], hide_index=True)